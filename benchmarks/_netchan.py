@@ -0,0 +1,19 @@
+# Loads net-chan.py as a module so the benchmarks can call its helpers
+# without starting the bot. Placeholder IDs are only used if .env is missing.
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# net-chan.py imports its helper modules (moderation.py) from the project root
+sys.path.insert(0, ROOT)
+
+def load():
+    for key in ("CHANNEL_ID", "AFFIRM_ID", "WEBHOOK_BOT_ID"):
+        os.environ.setdefault(key, "0")
+    os.chdir(ROOT)
+    spec = importlib.util.spec_from_file_location("netchan", os.path.join(ROOT, "net-chan.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["netchan"] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Measures per-image latency and upload size for each art output mode.
+# The sample images under images/ are first converted to WebP, since that
+# is what the image API hands back to !art.
+#
+#   python benchmarks/bench_art_output.py [rounds]
+import glob
+import io
+import os
+import statistics
+import sys
+import time
+
+from PIL import Image
+
+from _netchan import ROOT, load
+
+MODES = [
+    ("original", 85, 0),
+    ("png", 85, 0),
+    ("jpeg", 85, 0),
+    ("webp", 80, 0),
+    ("jpeg", 85, 300),
+]
+
+def sample_images():
+    samples = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "images", "**", "*.*"), recursive=True)):
+        with Image.open(path) as image:
+            with io.BytesIO() as buffer:
+                image.save(buffer, format="WEBP", quality=90)
+                samples.append((os.path.relpath(path, ROOT), buffer.getvalue()))
+    return samples
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    netchan = load()
+    samples = sample_images()
+    source_total = sum(len(data) for _, data in samples)
+    print(f"{len(samples)} sample images, {source_total / 1024:.0f} KiB as WebP, {rounds} rounds\n")
+    print(f"{'mode':<22}{'ms/image':>10}{'p95 ms':>10}{'KiB/image':>12}{'vs source':>11}")
+
+    for output_format, quality, max_size in MODES:
+        timings = []
+        total_bytes = 0
+        for _ in range(rounds):
+            # Skip the encode cache so every round pays the real cost
+            netchan.encode_art.cache_clear()
+            for _, data in samples:
+                start = time.perf_counter()
+                encoded, _ = netchan.encode_art(data, output_format, quality, max_size)
+                timings.append((time.perf_counter() - start) * 1000)
+                total_bytes += len(encoded)
+        per_image = total_bytes / (rounds * len(samples))
+        label = output_format if output_format == "original" else f"{output_format} q{quality}"
+        label += f" max{max_size}" if max_size else ""
+        p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+        print(f"{label:<22}{statistics.mean(timings):>10.2f}{p95:>10.2f}"
+              f"{per_image / 1024:>12.1f}{per_image * len(samples) / source_total:>10.2f}x")
+
+if __name__ == "__main__":
+    main()
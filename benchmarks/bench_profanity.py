@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# Compares the compiled profanity matcher behind naughty_naughty() with the
+# previous normalize + better_profanity + spaced-out regex implementation.
+# The corpus is built from responses.json with censored words mixed in
+# plain, leetspeak, spaced-out and split.
+#
+#   python benchmarks/bench_profanity.py [messages]
+import json
+import os
+import random
+import re
+import sys
+import time
+
+from better_profanity import profanity
+
+from _netchan import ROOT, load
+from moderation import normalize_text
+
+def legacy_naughty_naughty(input_text):
+    cleaned_text = normalize_text(input_text)
+
+    if profanity.contains_profanity(cleaned_text):
+        return True
+
+    spaced_out_check = re.search(r"\b([a-z])\s*([a-z])\s*([a-z])\s*([a-z])\s*([a-z])\b", cleaned_text)
+    if spaced_out_check and profanity.contains_profanity("".join(spaced_out_check.groups())):
+        return True
+
+    return False
+
+def disguise(word, rng):
+    style = rng.randrange(4)
+    if style == 0:
+        return word
+    if style == 1:
+        return word.translate(str.maketrans("aeois", "4301$"))
+    if style == 2:
+        return " ".join(word)
+    cut = rng.randrange(1, len(word))
+    return f"{word[:cut]} {word[cut:]}"
+
+def build_corpus(count, seed=1234):
+    rng = random.Random(seed)
+    with open(os.path.join(ROOT, "responses.json"), "r") as f:
+        lines = [line for responses in json.load(f).values() for line in responses]
+    words = [str(word) for word in profanity.CENSOR_WORDSET if str(word).isalpha() and len(str(word)) >= 4]
+    corpus = []
+    for _ in range(count):
+        text = rng.choice(lines)
+        if rng.random() < 0.2:
+            parts = text.split(" ")
+            parts.insert(rng.randrange(len(parts) + 1), disguise(rng.choice(words), rng))
+            text = " ".join(parts)
+        corpus.append(text)
+    return corpus
+
+def timed(label, func, corpus):
+    start = time.perf_counter()
+    results = [func(text) for text in corpus]
+    elapsed = time.perf_counter() - start
+    chars = sum(len(text) for text in corpus)
+    print(f"{label:<10}{elapsed:>9.2f}s{len(corpus) / elapsed:>12,.0f} msg/s"
+          f"{chars / elapsed / 1e6:>9.2f} MB/s{sum(results):>9} flagged")
+    return results
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    netchan = load()
+    corpus = build_corpus(count)
+    print(f"{count} messages, {sum(len(text) for text in corpus) / 1e6:.1f} MB\n")
+
+    legacy = timed("legacy", legacy_naughty_naughty, corpus)
+    compiled = timed("compiled", netchan.naughty_naughty, corpus)
+
+    only_compiled = [text for text, old, new in zip(corpus, legacy, compiled) if new and not old]
+    only_legacy = [text for text, old, new in zip(corpus, legacy, compiled) if old and not new]
+    print(f"\nflagged only by compiled: {len(only_compiled)}, only by legacy: {len(only_legacy)}")
+    for text in only_legacy[:5]:
+        print(f"  legacy only: {text!r}")
+
+if __name__ == "__main__":
+    main()
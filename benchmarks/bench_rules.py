@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# Replays a recorded corpus of webhook-bot messages through the compiled
+# rule engine in on_message and through the old substring checks, then
+# reports throughput and every message the two classify differently.
+# Record your own corpus by setting EMBED_CORPUS_FILE while the bot runs.
+#
+#   python benchmarks/bench_rules.py [corpus.jsonl] [rounds]
+import json
+import os
+import sys
+import time
+
+from _netchan import ROOT, load
+
+def legacy_classify(parts):
+    if "title" in parts:
+        embed_title = parts["title"].lower()
+        if "up" in embed_title:
+            return "kuma"
+        if "down" in embed_title:
+            return "fire"
+        return "unraid"
+    message_content = parts.get("content", "").strip().lower()
+    if any(keyword in message_content for keyword in ['error', 'down', 'errors']):
+        return "fire"
+    if 'up' in message_content:
+        return "kuma"
+    return "unraid"
+
+def timed(label, func, corpus, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for parts in corpus:
+            func(parts)
+    elapsed = time.perf_counter() - start
+    total = len(corpus) * rounds
+    print(f"{label:<10}{elapsed:>8.3f}s{total / elapsed:>14,.0f} msg/s{elapsed / total * 1e6:>9.2f} µs/msg")
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, "benchmarks", "embed_corpus.jsonl")
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    netchan = load()
+    with open(path, "r", encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    print(f"{len(corpus)} recorded messages from {os.path.relpath(path, ROOT)}, {rounds} rounds\n")
+
+    timed("legacy", legacy_classify, corpus, rounds)
+    timed("rules", netchan.webhook_rules.classify, corpus, rounds)
+
+    print("\nmessages classified differently (legacy -> rules):")
+    for parts in corpus:
+        old = legacy_classify(parts)
+        rule = netchan.webhook_rules.classify(parts)
+        if old != rule.category:
+            text = parts.get("title") or parts.get("content")
+            print(f"  {old:>7} -> {rule.category:<7} [{rule.name}] {text}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# Measures cold start: how long net-chan.py takes to import and initialise,
+# to have the webhook port listening, and to reach the point where main()
+# hands over to the Discord gateway (bot.start is stubbed out, so no token
+# or network is needed). Every run is a fresh interpreter.
+#
+#   python benchmarks/bench_startup.py [runs]
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from _netchan import ROOT
+
+CHILD = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, "benchmarks")
+from _netchan import load
+marks = {}
+nc = load()
+marks["import"] = time.perf_counter() - started
+start_webhook_server = nc.start_webhook_server
+
+async def timed_webhook_server():
+    runner = await start_webhook_server()
+    marks["webhook"] = time.perf_counter() - started
+    return runner
+
+async def fake_start(token):
+    marks["gateway"] = time.perf_counter() - started
+
+nc.start_webhook_server = timed_webhook_server
+nc.bot.start = fake_start
+asyncio.run(nc.main())
+print(json.dumps(marks))
+"""
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    env = dict(os.environ, WEBHOOK_PORT="0", LOG_LEVEL="WARNING")
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(f"{runs} cold starts (median / min, ms)")
+    for label, key in (("import + init", "import"), ("webhook listening", "webhook"), ("gateway connect", "gateway")):
+        values = [result[key] * 1000 for result in results]
+        print(f"{label:<20}{statistics.median(values):>8.0f}{min(values):>8.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -55,9 +55,8 @@ def install_dependencies(pip_path):
     # List of required packages
     requirements = [
         "discord.py==2.3.2",
-        "Flask==2.3.3",
+        "aiohttp==3.8.6",
         "python-dotenv==1.0.0",
-        "requests==2.31.0",
         "Pillow==10.1.0",
         "better-profanity==0.7.0"
     ]
@@ -94,26 +93,6 @@ def create_directories():
     
     return True
 
-def initialize_memory_files():
-    print("\n👾 Initializing memory files... (｡•̀ᴗ•́｡)✧")
-    
-    # Initialize memory files with empty JSON objects
-    memory_files = [
-        "memory/art_delay.json",
-        "memory/wake_delay.json",
-        "memory/known_users.json"
-    ]
-    
-    for file_path in memory_files:
-        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-            with open(file_path, "w") as f:
-                f.write("{}")
-            print(f"✅ Initialized {file_path}")
-        else:
-            print(f"✓ {file_path} already exists")
-    
-    return True
-
 def create_sample_responses():
     print("\n👾 Creating sample responses file... (≧◡≦)")
     
@@ -228,7 +207,6 @@ def main():
     steps = [
         ("Installing dependencies", lambda: install_dependencies(pip_path)),
         ("Creating directories", create_directories),
-        ("Initializing memory files", initialize_memory_files),
         ("Creating sample responses", create_sample_responses),
         ("Setting up environment variables", setup_env_file),
         ("Creating activation scripts", lambda: create_activation_script(venv_dir, python_path))
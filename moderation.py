@@ -0,0 +1,151 @@
+# Profanity matching for naughty_naughty() and !scan. It lives apart from
+# net-chan.py so the !scan worker processes can import it without starting
+# a second bot: importing it must stay free of side effects.
+import bisect
+import re
+from collections import deque, namedtuple
+
+# ----------------------------------------------------------------------------------
+# Profanity Filter
+# ----------------------------------------------------------------------------------
+CHAR_SUBSTITUTIONS = str.maketrans("4301$@!", "aeolsai")
+
+def normalize_text(text: str) -> str:
+    text = text.lower().translate(CHAR_SUBSTITUTIONS)
+    text = re.sub(r"[^a-z0-9\s]", "", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+class ProfanityMatcher:
+    # Aho-Corasick automaton over the censor list. Words are stored with their
+    # spaces removed and text is scanned as one continuous stream of letters,
+    # so "sh1t", "s h i t" and "sh it" all walk the same path. A match only
+    # counts if it starts at the beginning of a word and ends at the end of
+    # one, which keeps "class" or "scunthorpe" from tripping it.
+    # Look-alike letters better_profanity also accepts are folded together.
+    FOLD = str.maketrans("lv57+", "iustt")
+    ALPHABET = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+    BREAK = "\x00"
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for word in words:
+            key = "".join(ch for ch in self.fold(word) if ch in self.ALPHABET)
+            if len(key) >= 2:
+                self._insert(key, word)
+        self._link()
+
+    @classmethod
+    def fold(cls, text: str) -> str:
+        return text.lower().translate(CHAR_SUBSTITUTIONS).translate(cls.FOLD)
+
+    def _insert(self, key, word):
+        state = 0
+        for ch in key:
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][ch] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(())
+            state = next_state
+        if not self.out[state]:
+            self.out[state] = ((len(key), word),)
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.out[next_state] = self.out[next_state] + self.out[self.fail[next_state]]
+
+    def finditer(self, text: str):
+        # Yields (start, end, word) with offsets into the original text.
+        # Whitespace separates words, other punctuation is skipped over.
+        goto, fail, out, alphabet = self.goto, self.fail, self.out, self.ALPHABET
+        state = 0
+        positions = []
+        word_starts = bytearray()
+        at_word_start = True
+        pending = ()
+        for index, ch in enumerate(self.fold(text)):
+            if ch in alphabet:
+                pending = ()
+                positions.append(index)
+                word_starts.append(at_word_start)
+                at_word_start = False
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+                if out[state]:
+                    pending = out[state]
+            elif ch.isspace():
+                if pending:
+                    yield from self._confirm(pending, positions, word_starts)
+                    pending = ()
+                at_word_start = True
+            elif ch == self.BREAK:
+                # Hard boundary between batched messages: nothing spans it
+                if pending:
+                    yield from self._confirm(pending, positions, word_starts)
+                    pending = ()
+                at_word_start = True
+                state = 0
+        if pending:
+            yield from self._confirm(pending, positions, word_starts)
+
+    @staticmethod
+    def _confirm(words, positions, word_starts):
+        end = len(positions)
+        for length, word in words:
+            start = end - length
+            if word_starts[start]:
+                yield positions[start], positions[-1] + 1, word
+
+    def contains(self, text: str) -> bool:
+        for _ in self.finditer(text):
+            return True
+        return False
+
+profanity_matcher = None
+
+def get_profanity_matcher():
+    # Importing better_profanity and building the automaton from its word
+    # list is the slowest part of startup, so it waits for the first check.
+    global profanity_matcher
+    if profanity_matcher is None:
+        from better_profanity import profanity
+        profanity.load_censor_words()
+        profanity_matcher = ProfanityMatcher(str(word) for word in profanity.CENSOR_WORDSET)
+    return profanity_matcher
+
+# ----------------------------------------------------------------------------------
+# Batch Moderation
+# ----------------------------------------------------------------------------------
+ModerationHit = namedtuple("ModerationHit", ["key", "start", "end", "word"])
+
+def scan_batch(items):
+    # Scans a chunk of (key, text) pairs in one pass: the texts are joined with
+    # a hard break so folding runs once over the whole chunk, then every hit
+    # is mapped back to its message with a binary search over the offsets.
+    texts = [text.replace(ProfanityMatcher.BREAK, " ") for _, text in items]
+    offsets = []
+    position = 0
+    for text in texts:
+        offsets.append(position)
+        position += len(text) + 1
+    hits = []
+    for start, end, word in get_profanity_matcher().finditer(ProfanityMatcher.BREAK.join(texts)):
+        index = bisect.bisect_right(offsets, start) - 1
+        base = offsets[index]
+        hits.append(ModerationHit(items[index][0], start - base, end - base, word))
+    return hits
@@ -1,29 +1,88 @@
 # ==================================================================================
 # IMPORTS AND SETUP
 # ==================================================================================
+import sys
+import time
+
+# `python net-chan.py --profile-startup` times every import below and reports
+# how long each startup phase took once the bot is ready.
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+STARTUP_CLOCK = time.perf_counter()
+startup_marks = []
+import_times = {}
+if PROFILE_STARTUP:
+    import builtins
+    real_import = builtins.__import__
+    import_depth = 0
+
+    def timed_import(name, *args, **kwargs):
+        # Only imports made directly by this file are timed; whatever they
+        # pull in is counted towards them.
+        global import_depth
+        if import_depth:
+            return real_import(name, *args, **kwargs)
+        import_depth += 1
+        started = time.perf_counter()
+        try:
+            return real_import(name, *args, **kwargs)
+        finally:
+            import_depth -= 1
+            import_times[name] = import_times.get(name, 0.0) + time.perf_counter() - started
+
+    builtins.__import__ = timed_import
+
 import os
 import discord
 from discord.ext import commands
-from flask import Flask, request
+import aiohttp
+from aiohttp import web
 import asyncio
-from threading import Thread
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import random
-import requests
 import io
-from PIL import Image
 import json
-from better_profanity import profanity
+import logging
+import logging.handlers
+import copy
+import queue
 import re
 import base64
+import bisect
+import heapq
+import threading
+import traceback
+from zoneinfo import ZoneInfo
+import functools
+import hashlib
+import hmac
+from urllib.parse import urlsplit, parse_qs
+import sqlite3
+import multiprocessing
+import signal
+from collections.abc import Mapping
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from moderation import get_profanity_matcher, scan_batch
+if PROFILE_STARTUP:
+    builtins.__import__ = real_import
+    startup_marks.append(("imports", time.perf_counter() - STARTUP_CLOCK))
 # ==================================================================================
 # CONSTANTS AND CONFIGURATION
 # ==================================================================================
 # File Paths
-ART_DELAY_FILE = "./memory/art_delay.json"
-WAKE_DELAY_FILE = "./memory/wake_delay.json"
+COOLDOWN_FILE = "./memory/cooldowns.json"
+SCHEDULE_FILE = "./memory/schedule.json"
 KNOWN_USERS = "./memory/known_users.json"
+PROFILE_DB = "./memory/profiles.db"
+RESPONSES_FILE = "./responses.json"
+MUSIC_FILE = "./music.json"
+RULES_FILE = "./rules.json"
+ROUTES_FILE = "./routes.json"
+ASSETS_DIR = "./images"
+JOURNAL_DIR = "./memory/journal"
+SPILL_DIR = "./memory/spill"
+ART_CACHE_DIR = "./memory/art_cache"
 
 # Load environment variables
 load_dotenv()
@@ -31,17 +90,176 @@ TOKEN = os.getenv("DISCORD_TOKEN")
 CHANNEL_ID = int(os.getenv("CHANNEL_ID"))
 AFFIRM_ID = int(os.getenv("AFFIRM_ID"))
 
+# Webhook Server
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "5000"))
+WEBHOOK_BACKLOG = 1024
+# Signed webhooks: "source:key,source2:key2". Without keys, unsigned POSTs are accepted.
+WEBHOOK_KEYS = os.getenv("WEBHOOK_KEYS", "")
+WEBHOOK_MAX_SKEW = int(os.getenv("WEBHOOK_MAX_SKEW", "300"))
+# Requests per minute per signed source (or per IP when unsigned); 0 means unlimited.
+# Unsigned senders often burst from one host, so they default to unlimited.
+WEBHOOK_RATE_LIMIT = max(0, int(os.getenv("WEBHOOK_RATE_LIMIT", "60" if WEBHOOK_KEYS else "0")))
+# Backpressure: how many notifications each channel may have waiting, and what
+# happens beyond that ("reject", "drop_oldest", "drop_priority" or "spill")
+OUTBOUND_QUEUE_MAX = int(os.getenv("OUTBOUND_QUEUE_MAX", "500"))
+INGRESS_OVERFLOW = os.getenv("INGRESS_OVERFLOW", "reject").lower()
+
+# Art Output ("original" sends the API's WebP bytes untouched)
+ART_OUTPUT_FORMAT = os.getenv("ART_OUTPUT_FORMAT", "original").lower()
+ART_OUTPUT_QUALITY = int(os.getenv("ART_OUTPUT_QUALITY", "85"))
+ART_OUTPUT_MAX_SIZE = int(os.getenv("ART_OUTPUT_MAX_SIZE", "0"))
+ART_CACHE_MAX_MB = int(os.getenv("ART_CACHE_MAX_MB", "200"))
+ART_CACHE_MAX_DAYS = int(os.getenv("ART_CACHE_MAX_DAYS", "30"))
+ART_POOL_SIZE = int(os.getenv("ART_POOL_SIZE", "6"))
+ART_POOL_DAILY_BUDGET = int(os.getenv("ART_POOL_DAILY_BUDGET", "12"))
+ART_POOL_INTERVAL = 120
+
+# Bot images ("original" sends the files as they are on disk)
+ASSET_OUTPUT_FORMAT = os.getenv("ASSET_OUTPUT_FORMAT", "original").lower()
+ASSET_MAX_SIZE = int(os.getenv("ASSET_MAX_SIZE", "0"))
+
+# Moderation
+MODERATION_WORKERS = int(os.getenv("MODERATION_WORKERS", str(min(4, os.cpu_count() or 1))))
+MODERATE_MESSAGES = os.getenv("MODERATE_MESSAGES", "0") == "1"
+MODERATION_SCAN_MAX = 100000
+
+# Scheduling (BOT_TIMEZONE is an IANA name like "Europe/Berlin"; default is the host's zone)
+BOT_TIMEZONE = os.getenv("BOT_TIMEZONE")
+SCHEDULER_MAX_SLEEP = 60
+
+# Logging (LOG_FORMAT is "text" or "json"; LOG_DEBUG_DUMPS=1 logs full webhook messages)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_DEBUG_DUMPS = os.getenv("LOG_DEBUG_DUMPS", "0") == "1"
+
+# Profiling (can also be switched on at runtime with !perf on)
+PERF_ENABLED = os.getenv("PERF_ENABLED", "0") == "1"
+PERF_SLOW_CALLBACK_MS = int(os.getenv("PERF_SLOW_CALLBACK_MS", "100"))
+
+# Daytime hours; affirmations are sent inside them, art is pre-generated outside
+DAYTIME_START_HOUR = 8
+DAYTIME_END_HOUR = 20
+
 # ==================================================================================
 # GLOBAL VARIABLES
 # ==================================================================================
-last_response_time = None
-last_response_time_lock = asyncio.Lock()
-last_wake_message_time = None
-wake_message_lock = asyncio.Lock()
-praise_counter = 1
-art_count = 0
-webhook_log = []
+ART_DAILY_LIMIT = 6
+COOLDOWN_FLUSH_INTERVAL = 30
 MAX_LOG_SIZE = 100
+JOURNAL_SEGMENT_BYTES = 1024 * 1024
+JOURNAL_MAX_SEGMENTS = 8
+JOURNAL_FLUSH_INTERVAL = 0.5
+OUTBOUND_COALESCE_WINDOW = 1.0
+EMBED_MAX_FIELDS = 25
+EMBED_MAX_CHARS = 6000
+EMBED_FIELD_NAME_MAX = 256
+EMBED_FIELD_VALUE_MAX = 1024
+WEBHOOK_AGGREGATE_WINDOW = float(os.getenv("WEBHOOK_AGGREGATE_WINDOW", "10"))
+EMBED_CORPUS_FILE = os.getenv("EMBED_CORPUS_FILE")
+LOOP_LAG_INTERVAL = 1.0
+METRICS_MAX_LABELS = 100
+LOG_SAMPLE_BURST = 20
+LOG_SAMPLE_WINDOW = 60
+PERF_HEARTBEAT_INTERVAL = 0.05
+PERF_STACK_DEPTH = 3
+ROUTE_CACHE_SIZE = 1024
+ASSET_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif")
+ASSET_URL_TTL = 24 * 3600
+WEBHOOK_REPLAY_CACHE = 10000
+INGRESS_RETRY_AFTER = 5
+GATEWAY_RETRY_AFTER = 30
+
+# ==================================================================================
+# LOGGING
+# ==================================================================================
+# Records are handed to a queue and written by a listener thread, so neither
+# the event loop nor the worker threads ever block on stdout.
+LOG_RECORD_FIELDS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "taskName", "sample"}
+
+def log_extras(record):
+    return {key: value for key, value in record.__dict__.items() if key not in LOG_RECORD_FIELDS}
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(log_extras(record))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextLogFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-8s %(name)s: %(message)s", "%Y-%m-%d %H:%M:%S")
+
+    def formatMessage(self, record):
+        text = super().formatMessage(record)
+        extras = log_extras(record)
+        if extras:
+            text += " " + " ".join(f"{key}={value!r}" for key, value in extras.items())
+        return text
+
+
+class LogSampler(logging.Filter):
+    # Records logged with extra={"sample": key} are let through LOG_SAMPLE_BURST
+    # times per LOG_SAMPLE_WINDOW for each key; the next one let through
+    # carries how many were dropped in between.
+    def __init__(self, burst, window):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.windows = {}
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        started, seen, dropped = self.windows.get(key, (0.0, 0, 0))
+        if record.created - started >= self.window:
+            started, seen = record.created, 0
+        if seen >= self.burst:
+            self.windows[key] = (started, seen, dropped + 1)
+            return False
+        if dropped:
+            record.suppressed = dropped
+        self.windows[key] = (started, seen + 1, 0)
+        return True
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    # The stock handler folds the traceback into the message; keep it apart
+    # so the JSON output has it as its own field.
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonLogFormatter() if LOG_FORMAT == "json" else TextLogFormatter())
+    log_queue = queue.SimpleQueue()
+    queue_handler = LogQueueHandler(log_queue)
+    queue_handler.addFilter(LogSampler(LOG_SAMPLE_BURST, LOG_SAMPLE_WINDOW))
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+logger = logging.getLogger("netchan")
+log_listener = None
 
 # ==================================================================================
 # DISCORD BOT SETUP
@@ -53,71 +271,1051 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 # ==================================================================================
 # HELPER FUNCTIONS
 # ==================================================================================
+# ----------------------------------------------------------------------------------
+# Metrics
+# ----------------------------------------------------------------------------------
+# Everything here is only touched from the event loop thread, so plain ints
+# are enough: no locks, and observing a value never allocates.
+class Counter:
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.values = {}
+
+    def inc(self, label_value, amount=1):
+        if label_value not in self.values and len(self.values) >= METRICS_MAX_LABELS:
+            label_value = "other"
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        yield f"# TYPE {self.name} counter"
+        for label_value, count in self.values.items():
+            yield f'{self.name}{{{self.label}="{escape_label(label_value)}"}} {count}'
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        yield f"# TYPE {self.name} histogram"
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{le="{bound}"}} {cumulative}'
+        yield f'{self.name}_bucket{{le="+Inf"}} {self.count}'
+        yield f"{self.name}_sum {self.sum}"
+        yield f"{self.name}_count {self.count}"
+
+
+class Gauge:
+    # Read at scrape time, so the hot paths don't have to keep it updated
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self):
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read()}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+metrics = []
+
+def register_metric(metric):
+    metrics.append(metric)
+    return metric
+
+def render_metrics():
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+events_total = register_metric(Counter("netchan_events_total", "Events recorded, by type.", "type"))
+routes_dropped_total = register_metric(Counter("netchan_route_dropped_total", "Notifications held back by a route's rate limit.", "route"))
+ingress_dropped_total = register_metric(Counter("netchan_ingress_dropped_total", "Notifications dropped or refused because a queue was full, by reason.", "reason"))
+webhook_requests_total = register_metric(Counter("netchan_webhook_requests_total", "Webhook requests, by HTTP status.", "status"))
+notify_latency = register_metric(Histogram(
+    "netchan_notify_latency_seconds", "Time from webhook arrival to the Discord message being sent.",
+    (0.1, 0.25, 0.5, 1, 1.5, 2, 3, 5, 10, 30),
+))
+art_generation_time = register_metric(Histogram(
+    "netchan_art_generation_seconds", "Time spent waiting on the art API.",
+    (1, 2, 5, 10, 15, 20, 30, 45, 60, 120),
+))
+json_load_time = register_metric(Histogram(
+    "netchan_json_load_seconds", "Time spent loading and indexing watched JSON files.",
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+))
+loop_lag = 0.0
+register_metric(Gauge("netchan_event_loop_lag_seconds", "How late the last loop lag probe woke up.", lambda: loop_lag))
+register_metric(Gauge("netchan_outbound_queue_depth", "Notifications waiting to be sent to Discord.", lambda: outbound_depth()))
+register_metric(Gauge("netchan_gateway_connected", "1 while the Discord gateway is connected.", lambda: int(gateway_ready.is_set())))
+register_metric(Gauge("netchan_art_cache_bytes", "Size of the generated art cache.", lambda: art_cache.total_bytes))
+
+async def monitor_loop_lag():
+    # The time a sleep overshoots is how long callbacks kept the loop busy
+    global loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag = max(0.0, loop.time() - expected)
+
+# ----------------------------------------------------------------------------------
+# Performance Profiling
+# ----------------------------------------------------------------------------------
+class LoopWatchdog:
+    # A heartbeat task on the loop and a watcher thread beside it. When the
+    # heartbeat is late by more than the threshold, something is blocking the
+    # loop, so the watcher grabs the loop thread's stack right then. The stall
+    # is charged to that stack once the heartbeat gets to run again.
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.offenders = {}
+        self.lock = threading.Lock()
+        self.task = None
+        self.thread = None
+        self.stop_event = None
+        self.loop_thread = None
+        self.beat = 0.0
+        self.captured_beat = None
+        self.pending = None
+
+    @property
+    def enabled(self):
+        return self.task is not None
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self.stop_event = threading.Event()
+        self.task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self.thread = threading.Thread(target=self._watch, args=(self.stop_event,), name="loop-watchdog", daemon=True)
+        self.thread.start()
+        logger.info("Loop watchdog enabled, threshold %d ms", self.threshold * 1000)
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.stop_event.set()
+        self.task.cancel()
+        self.task = None
+        self.thread = None
+        logger.info("Loop watchdog disabled")
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(PERF_HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            stalled = now - self.beat - PERF_HEARTBEAT_INTERVAL
+            self.beat = now
+            with self.lock:
+                if self.pending is not None:
+                    entry = self.offenders[self.pending]
+                    entry[1] += stalled
+                    entry[2] = max(entry[2], stalled)
+                    logger.warning("Event loop blocked for %d ms", stalled * 1000, extra={"where": self.pending})
+                    self.pending = None
+
+    def _watch(self, stop_event):
+        while not stop_event.wait(self.threshold / 2):
+            beat = self.beat
+            if time.monotonic() - beat - PERF_HEARTBEAT_INTERVAL < self.threshold or beat == self.captured_beat:
+                continue
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            self.captured_beat = beat
+            stack = traceback.extract_stack(frame)[-PERF_STACK_DEPTH:]
+            where = " < ".join(f"{os.path.basename(f.filename)}:{f.lineno} {f.name}" for f in reversed(stack))
+            with self.lock:
+                self.offenders.setdefault(where, [0, 0.0, 0.0])[0] += 1
+                self.pending = where
+
+    def top(self, count=5):
+        # (where, times caught, total stalled seconds, longest stall)
+        with self.lock:
+            entries = [(where, *entry) for where, entry in self.offenders.items()]
+        return sorted(entries, key=lambda entry: entry[2], reverse=True)[:count]
+
+    def reset(self):
+        with self.lock:
+            self.offenders.clear()
+            self.pending = None
+
+loop_watchdog = LoopWatchdog(PERF_SLOW_CALLBACK_MS / 1000)
+
+# command name -> [runs, total seconds, slowest run]
+command_timings = {}
+
+def record_command_timing(name, elapsed):
+    entry = command_timings.setdefault(name, [0, 0.0, 0.0])
+    entry[0] += 1
+    entry[1] += elapsed
+    entry[2] = max(entry[2], elapsed)
+
+def startup_mark(label):
+    if PROFILE_STARTUP:
+        startup_marks.append((label, time.perf_counter() - STARTUP_CLOCK))
+
+def startup_report():
+    lines = ["Startup profile (ms since launch):"]
+    lines += [f"  {label:<20}{elapsed * 1000:>8.0f}" for label, elapsed in startup_marks]
+    lines.append("Slowest imports (ms):")
+    slowest = sorted(import_times.items(), key=lambda item: item[1], reverse=True)[:10]
+    lines += [f"  {name:<20}{elapsed * 1000:>8.1f}" for name, elapsed in slowest]
+    logger.info("\n".join(lines))
+
 # ----------------------------------------------------------------------------------
 # Response Management
 # ----------------------------------------------------------------------------------
+class WatchedJSONFile:
+    # Keeps a parsed JSON file in memory and rebuilds it when the file's mtime
+    # changes. The stat is throttled so hot paths only pay for a clock read.
+    CHECK_INTERVAL = 2.0
+
+    def __init__(self, path, default):
+        self.path = path
+        self.default = default
+        self._mtime = None
+        self._last_check = 0.0
+        self.reload()
+
+    def reload(self):
+        started = time.perf_counter()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None:
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Error loading %s, keeping previous data: %s", self.path, e)
+                if self._mtime is not None:
+                    self._mtime = mtime
+                    return
+                data = self.default
+        else:
+            data = self.default
+        try:
+            self._build(data)
+        except Exception:
+            # Remember the mtime anyway so a bad file is reported once, not on every refresh
+            logger.exception("Error building %s, keeping previous data.", self.path)
+            if self._mtime is None:
+                self._build(self.default)
+        self._mtime = mtime
+        json_load_time.observe(time.perf_counter() - started)
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._last_check < self.CHECK_INTERVAL:
+            return
+        self._last_check = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            logger.info("%s changed, reloading.", self.path)
+            self.reload()
+
+    def _build(self, data):
+        raise NotImplementedError
+
+
+class ResponseCatalog(WatchedJSONFile):
+    DEFAULT_RESPONSE = "🌸 **Net-chan Update!** 🌸"
+
+    def __init__(self, path):
+        self.templates = {}
+        super().__init__(path, {})
+
+    def _build(self, data):
+        # Each template is stored as (text, takes_message) with the escaped
+        # newlines already expanded, so a lookup never touches the raw JSON.
+        templates = {}
+        if not isinstance(data, dict):
+            data = {}
+        for event_type, responses in data.items():
+            if isinstance(responses, list) and responses:
+                templates[event_type] = [
+                    (str(response).replace("\\n", "\n"), '{message}' in str(response))
+                    for response in responses
+                ]
+        self.templates = templates
+
+    def get(self, event_type, message):
+        self.refresh()
+        choices = self.templates.get(event_type)
+        if not choices:
+            return self.DEFAULT_RESPONSE
+        response, takes_message = random.choice(choices)
+        if takes_message:
+            response = response.format(message=f"\n\n({message})")
+        return response
+
+
+response_catalog = ResponseCatalog(RESPONSES_FILE)
+
 def get_response(event_type, message):
-    if os.path.exists('./responses.json'):
-        with open('./responses.json', 'r') as f:
-            json_data = json.load(f)
-    else:
-        json_data = {}
+    return response_catalog.get(event_type, message)
 
-    if event_type in json_data:
-        responses = json_data[event_type]
-        response = random.choice(responses)
-    else:
-        response = "🌸 **Net-chan Update!** 🌸"
-    if '{message}' in response:
-            response = response.format(message=f"\n\n({message})")
-    return response.replace("\\n", "\n")
+# ----------------------------------------------------------------------------------
+# Event Log
+# ----------------------------------------------------------------------------------
+LogRecord = namedtuple("LogRecord", ["timestamp", "source", "event_type", "message"])
+
+class EventLog:
+    # Fixed-size ring buffer of recent events. Every record also sits in a
+    # per-event-type deque, and the oldest record is dropped from both at once,
+    # so filtered queries only walk the records they return.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.records = deque(maxlen=capacity)
+        self.by_type = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, source, event_type, message, timestamp=None):
+        record = LogRecord(timestamp or time.time(), source, event_type, message)
+        if len(self.records) == self.capacity:
+            oldest = self.records[0]
+            key = oldest.event_type.lower()
+            index = self.by_type[key]
+            index.popleft()
+            if not index:
+                del self.by_type[key]
+        self.records.append(record)
+        self.by_type.setdefault(event_type.lower(), deque()).append(record)
+        return record
+
+    def query(self, event_type=None, limit=5, since=None):
+        records = self.records if event_type is None else self.by_type.get(event_type.lower(), ())
+        results = []
+        for record in reversed(records):
+            if since is not None and record.timestamp < since:
+                break
+            results.append(record)
+            if len(results) >= limit:
+                break
+        results.reverse()
+        return results
+
+    def event_types(self):
+        return sorted(self.by_type)
+
+event_log = EventLog(MAX_LOG_SIZE)
+
+class EventJournal:
+    # Append-only JSONL journal split into numbered segments. Appends are
+    # buffered and written by a single worker thread in batches with one
+    # fsync per batch, so the event loop never waits on the disk. Segments
+    # rotate by size and only the newest JOURNAL_MAX_SEGMENTS are kept.
+    SEGMENT_PATTERN = re.compile(r"events-(\d+)\.jsonl$")
+
+    def __init__(self, directory, segment_bytes, max_segments, flush_interval):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.flush_task = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._repair_tail()
+
+    def _repair_tail(self):
+        # Cut off a half-written last line so new appends start on a clean line
+        segments = self.segments()
+        if not segments:
+            return
+        if os.path.getsize(segments[-1]) == 0:
+            return
+        with open(segments[-1], "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.seek(0)
+                data = f.read()
+                f.truncate(data.rfind(b"\n") + 1)
+                logger.warning("Repaired truncated journal entry in %s", segments[-1])
+
+    def segments(self):
+        numbered = []
+        for name in os.listdir(self.directory):
+            match = self.SEGMENT_PATTERN.match(name)
+            if match:
+                numbered.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return [path for _, path in sorted(numbered)]
+
+    def segment_path(self, number):
+        return os.path.join(self.directory, f"events-{number:06d}.jsonl")
+
+    def append(self, record):
+        self.pending.append(json.dumps(record._asdict(), ensure_ascii=False))
+        if self.flush_task is None:
+            self.flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        self.flush_task = None
+        if not self.pending:
+            return
+        lines, self.pending = self.pending, []
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self._write_batch, lines)
+        except OSError as e:
+            logger.error("Failed to write %d journal entries: %s", len(lines), e)
+
+    def _write_batch(self, lines):
+        segments = self.segments()
+        if segments and os.path.getsize(segments[-1]) < self.segment_bytes:
+            path = segments[-1]
+        else:
+            last = int(self.SEGMENT_PATTERN.search(segments[-1]).group(1)) if segments else 0
+            path = self.segment_path(last + 1)
+            segments.append(path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for old_path in segments[:-self.max_segments]:
+            os.remove(old_path)
+
+    def load_tail(self, count):
+        # Rebuild recent history from the newest segment, stepping back one
+        # segment only when a fresh rotation left the newest one short.
+        records = []
+        for path in reversed(self.segments()):
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            segment_records = []
+            for line in lines[-(count - len(records)):]:
+                try:
+                    data = json.loads(line)
+                    segment_records.append(LogRecord(**data))
+                except (json.JSONDecodeError, TypeError):
+                    continue
+            records = segment_records + records
+            if len(records) >= count:
+                break
+        return records[-count:]
+
+    async def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        await self.flush()
+        self.executor.shutdown(wait=True)
+
+event_journal = EventJournal(JOURNAL_DIR, JOURNAL_SEGMENT_BYTES, JOURNAL_MAX_SEGMENTS, JOURNAL_FLUSH_INTERVAL)
+
+def record_event(source, event_type, message):
+    events_total.inc(event_type.lower())
+    record = event_log.add(source, event_type, message)
+    event_journal.append(record)
+    return record
+
+def restore_event_log():
+    records = event_journal.load_tail(MAX_LOG_SIZE)
+    for record in records:
+        event_log.add(record.source, record.event_type, record.message, timestamp=record.timestamp)
+    logger.info("Restored %d events from the journal.", len(records))
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_duration(text):
+    match = re.fullmatch(r"(\d+)\s*([smhd])", text.strip().lower())
+    if not match:
+        return None
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
 
 # ----------------------------------------------------------------------------------
-# Profanity Filter
+# Outbound Queue
 # ----------------------------------------------------------------------------------
-profanity.load_censor_words()
+Notification = namedtuple("Notification", ["event_type", "message", "reply", "color", "received", "priority"])
+INGRESS_POLICIES = ("reject", "drop_oldest", "drop_priority", "spill")
+if INGRESS_OVERFLOW not in INGRESS_POLICIES:
+    logger.warning("Unknown INGRESS_OVERFLOW %r, rejecting notifications when a queue is full instead.", INGRESS_OVERFLOW)
+    INGRESS_OVERFLOW = "reject"
+
+# Set while the gateway is connected; queues hold their notifications otherwise
+gateway_ready = asyncio.Event()
+spill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spill")
+
+def truncate(text, limit):
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def build_notification_embeds(batch):
+    if len(batch) == 1:
+        item = batch[0]
+        embed = discord.Embed(description=item.reply, color=item.color)
+        embed.add_field(name="Event Type", value=truncate(item.event_type, EMBED_FIELD_VALUE_MAX), inline=False)
+        embed.add_field(name="Message", value=truncate(item.message, EMBED_FIELD_VALUE_MAX), inline=False)
+        return [embed]
+
+    # Several events in one window share an embed: the first reply sets the
+    # mood and every event becomes a field, split only at Discord's limits.
+    embeds = []
+    embed = None
+    used = 0
+    for item in batch:
+        name = truncate(item.event_type, EMBED_FIELD_NAME_MAX)
+        value = truncate(item.message, EMBED_FIELD_VALUE_MAX)
+        size = len(name) + len(value)
+        if embed is None or len(embed.fields) >= EMBED_MAX_FIELDS or used + size > EMBED_MAX_CHARS:
+            embed = discord.Embed(description=item.reply, color=item.color)
+            embeds.append(embed)
+            used = len(item.reply)
+        embed.add_field(name=name, value=value, inline=False)
+        used += size
+    return embeds
+
+class OutboundQueue:
+    # One bounded queue and one consumer task per channel. The consumer waits
+    # for the gateway, then a short window after the first event so a burst
+    # goes out as a single message. Once `capacity` notifications are
+    # waiting, `policy` decides between refusing the new one, dropping the
+    # oldest or least important one, or spilling to disk in arrival order.
+    def __init__(self, channel_id, window, capacity, policy):
+        self.channel_id = channel_id
+        self.window = window
+        self.capacity = capacity
+        self.policy = policy
+        self.items = deque()
+        self.wakeup = asyncio.Event()
+        self.spilled = 0
+        self.spill_path = os.path.join(SPILL_DIR, f"{channel_id}.jsonl")
+        self.task = None
+
+    @property
+    def depth(self):
+        return len(self.items) + self.spilled
+
+    def put(self, notification):
+        # Returns False if the notification was refused
+        if len(self.items) < self.capacity and not (self.spilled and self.policy == "spill"):
+            self.items.append(notification)
+        elif self.policy == "spill":
+            self._spill(notification)
+        elif self.policy == "drop_oldest" and self.items:
+            self.items.popleft()
+            self.items.append(notification)
+            ingress_dropped_total.inc("oldest")
+        elif self.policy == "drop_priority" and self.items:
+            lowest = min(self.items, key=lambda item: item.priority)
+            if lowest.priority >= notification.priority:
+                ingress_dropped_total.inc("priority")
+                return False
+            self.items.remove(lowest)
+            self.items.append(notification)
+            ingress_dropped_total.inc("priority")
+        else:
+            ingress_dropped_total.inc("full")
+            return False
+        self.start()
+        return True
 
-CHAR_SUBSTITUTIONS = str.maketrans("4301$@!", "aeolsai")
+    def start(self):
+        self.wakeup.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._consume())
+
+    async def _consume(self):
+        while True:
+            if not self.items and self.spilled:
+                await self._unspill()
+            if not self.items:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            await gateway_ready.wait()
+            if len(self.items) < EMBED_MAX_FIELDS - 1:
+                await asyncio.sleep(self.window)
+            batch = [self.items.popleft() for _ in range(min(EMBED_MAX_FIELDS, len(self.items)))]
+            await self._send(batch)
+
+    async def _send(self, batch):
+        channel = bot.get_channel(self.channel_id)
+        if channel is None:
+            logger.warning("Channel %s not available, dropped %d notifications.", self.channel_id, len(batch))
+            return
+        for embed in build_notification_embeds(batch):
+            try:
+                await channel.send(embed=embed)
+            except discord.HTTPException as e:
+                logger.error("Failed to send notification to %s: %s", self.channel_id, e)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Lost the connection mid-send: keep the batch for after the
+                # reconnect (embeds already sent may go out twice)
+                logger.warning("Connection lost while sending to %s, will retry: %s", self.channel_id, e)
+                self.items.extendleft(reversed(batch))
+                return
+        sent = time.monotonic()
+        for item in batch:
+            notify_latency.observe(sent - item.received)
+
+    def _spill(self, notification):
+        self.spilled += 1
+        line = json.dumps({
+            "event_type": notification.event_type,
+            "message": notification.message,
+            "reply": notification.reply,
+            "color": notification.color.value,
+            "priority": notification.priority,
+        }, ensure_ascii=False)
+        spill_executor.submit(self._append_spill, line)
+
+    def _append_spill(self, line):
+        try:
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.error("Failed to spill a notification for %s: %s", self.channel_id, e)
+
+    def _take_spill(self, count):
+        # Runs in spill_executor after every pending append
+        try:
+            with open(self.spill_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return [], 0
+        taken, rest = lines[:count], lines[count:]
+        if rest:
+            temp_path = self.spill_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.writelines(rest)
+            os.replace(temp_path, self.spill_path)
+        else:
+            os.remove(self.spill_path)
+        return taken, len(rest)
 
-def normalize_text(text: str) -> str:
-    text = text.lower().translate(CHAR_SUBSTITUTIONS)
-    text = re.sub(r"[^a-z0-9\s]", "", text) 
-    text = re.sub(r"\s+", " ", text).strip() 
-    return text
+    async def _unspill(self):
+        before = self.spilled
+        try:
+            lines, left = await asyncio.get_running_loop().run_in_executor(spill_executor, self._take_spill, self.capacity)
+        except OSError as e:
+            logger.error("Failed to read spilled notifications for %s: %s", self.channel_id, e)
+            self.spilled -= before
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                self.items.append(Notification(
+                    entry["event_type"], entry["message"], entry["reply"], discord.Color(entry["color"]),
+                    time.monotonic(), entry.get("priority", 0),
+                ))
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                logger.warning("Skipping a damaged spilled notification for %s: %s", self.channel_id, e)
+        # What is left on disk, plus anything spilled while the read was queued
+        self.spilled = left + self.spilled - before
+
+outbound_queues = {}
+
+def get_outbound_queue(channel_id):
+    queue = outbound_queues.get(channel_id)
+    if queue is None:
+        queue = outbound_queues[channel_id] = OutboundQueue(channel_id, OUTBOUND_COALESCE_WINDOW, OUTBOUND_QUEUE_MAX, INGRESS_OVERFLOW)
+    return queue
+
+def restore_spilled_notifications():
+    # Notifications spilled before a restart are delivered once the gateway is up
+    if not os.path.isdir(SPILL_DIR):
+        return
+    for entry in os.scandir(SPILL_DIR):
+        name, extension = os.path.splitext(entry.name)
+        if extension != ".jsonl" or not name.isdigit():
+            continue
+        with open(entry.path, "r", encoding="utf-8") as f:
+            count = sum(1 for _ in f)
+        if count:
+            queue = get_outbound_queue(int(name))
+            queue.spilled = count
+            queue.start()
+            logger.info("%d spilled notifications waiting for channel %s", count, name)
+
+def outbound_depth():
+    return sum(queue.depth for queue in outbound_queues.values())
 
-def naughty_naughty(input_text: str) -> bool:
-    cleaned_text = normalize_text(input_text)
+# ----------------------------------------------------------------------------------
+# Webhook Aggregation
+# ----------------------------------------------------------------------------------
+WebhookRule = namedtuple("WebhookRule", ["name", "category", "label", "color", "priority"])
+
+def parse_color(value):
+    if isinstance(value, int):
+        return discord.Color(value)
+    value = str(value)
+    if value.startswith("#"):
+        return discord.Color(int(value[1:], 16))
+    factory = getattr(discord.Color, value, None)
+    return factory() if callable(factory) else discord.Color.default()
+
+# Constructs that can't survive being wrapped in (?P<rN>...) and joined with other rules
+UNSAFE_RULE_REGEX = re.compile(r"\(\?[aiLmsux-]+\)|\(\?P[<=]|\(\?<(?![=!])|(?:^|[^\\])(?:\\\\)*\\(?:[1-9]|g<)")
+
+class RuleEngine(WatchedJSONFile):
+    # Classifies webhook-bot messages with the rules in rules.json. At load
+    # time the rules for each message part (title, content, a named embed
+    # field, ...) are compiled into one alternation ordered by priority, so
+    # classifying a message is a single regex scan per part.
+    DEFAULT = {"category": "unraid", "label": "updates", "color": "purple", "priority": 0}
+
+    def __init__(self, path):
+        self.patterns = {}
+        self.rules = {}
+        self.default_rule = None
+        super().__init__(path, {})
+
+    def _build(self, data):
+        if not isinstance(data, dict):
+            data = {}
+        default = {**self.DEFAULT, **data.get("default", {})}
+        default_rule = WebhookRule("default", default["category"], default["label"], parse_color(default["color"]), default["priority"])
+
+        by_part = {}
+        rules = {}
+        for index, spec in enumerate(data.get("rules", [])):
+            if "regex" in spec:
+                pattern = spec["regex"]
+            elif spec.get("keywords"):
+                pattern = r"\b(?:" + "|".join(re.escape(keyword) for keyword in spec["keywords"]) + r")\b"
+            else:
+                logger.warning("Rule %s has no regex or keywords, skipping it.", spec.get("name", index))
+                continue
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                logger.warning("Rule %s has an invalid regex, skipping it: %s", spec.get("name", index), e)
+                continue
+            if UNSAFE_RULE_REGEX.search(pattern):
+                # Inline flags, named groups and backreferences change meaning (or fail) once
+                # the pattern is spliced into the combined alternation
+                logger.warning("Rule %s uses inline flags, named groups or backreferences, skipping it.", spec.get("name", index))
+                continue
+            group = f"r{index}"
+            rules[group] = WebhookRule(
+                spec.get("name", group),
+                spec.get("category", default["category"]),
+                spec.get("label", spec.get("category", default["label"])),
+                parse_color(spec.get("color", default["color"])),
+                spec.get("priority", 0),
+            )
+            part = spec.get("match", "any").lower()
+            by_part.setdefault(part, []).append((rules[group].priority, index, group, pattern))
+
+        patterns = {}
+        for part, entries in by_part.items():
+            entries.sort(key=lambda entry: (-entry[0], entry[1]))
+            combined = "|".join(f"(?P<{group}>{pattern})" for _, _, group, pattern in entries)
+            try:
+                patterns[part] = (re.compile(combined, re.IGNORECASE), entries[0][0])
+            except re.error as e:
+                logger.warning("Rules for %s don't compile together, keeping the previous rules: %s", part, e)
+                return
 
-    if profanity.contains_profanity(cleaned_text):
-        return True
+        self.patterns = patterns
+        self.rules = rules
+        self.default_rule = default_rule
+
+    def classify(self, parts):
+        # `parts` maps "title", "description", "content", "field:<name>" etc.
+        # to text; "any" rules see every part.
+        self.refresh()
+        best = None
+        for part, (pattern, top_priority) in self.patterns.items():
+            texts = parts.values() if part == "any" else (parts.get(part),)
+            for text in texts:
+                if not text:
+                    continue
+                for match in pattern.finditer(text):
+                    rule = self.rules[match.lastgroup]
+                    if best is None or rule.priority > best.priority:
+                        best = rule
+                    if best.priority >= top_priority:
+                        break
+        return best or self.default_rule
+
+webhook_rules = RuleEngine(RULES_FILE)
+
+def message_parts(message):
+    parts = {"content": message.content or "", "author": str(message.author)}
+    if message.embeds:
+        embed = message.embeds[0]
+        parts["title"] = embed.title or ""
+        parts["description"] = embed.description or ""
+        for field in embed.fields:
+            parts[f"field:{(field.name or '').lower()}"] = field.value or ""
+    return parts
+
+# One thread, so corpus lines are appended in the order messages arrived
+corpus_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="corpus")
+
+def append_embed_corpus(line):
+    try:
+        with open(EMBED_CORPUS_FILE, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        logger.warning("Failed to record embed corpus: %s", e)
+
+def record_embed_corpus(parts):
+    # Appends the message to EMBED_CORPUS_FILE so the rule benchmark can replay real traffic
+    line = json.dumps(parts, ensure_ascii=False) + "\n"
+    asyncio.get_running_loop().run_in_executor(corpus_executor, append_embed_corpus, line)
+
+class WebhookAggregator:
+    # Collects messages from each webhook source for a short window and then
+    # answers once. Within a window only the latest rule matched for each
+    # monitor counts, so a burst of alerts becomes "7 down, 2 recovered".
+    def __init__(self, window):
+        self.window = window
+        self.buffers = {}
+        self.tasks = set()
+
+    def add(self, source, channel, monitor, rule):
+        # One buffer per source and channel, so alerts are summarised where they were posted
+        key = (source, channel.id)
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            timer = asyncio.get_running_loop().call_later(self.window, self._start_flush, key)
+            buffer = self.buffers[key] = {"channel": channel, "monitors": OrderedDict(), "timer": timer}
+        buffer["monitors"][monitor] = rule
+        buffer["monitors"].move_to_end(monitor)
+
+    def _start_flush(self, key):
+        # The loop only keeps a weak reference to tasks, so hold on to it until it's done
+        task = asyncio.get_running_loop().create_task(self.flush(key))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def pending(self):
+        return sum(len(buffer["monitors"]) for buffer in self.buffers.values())
+
+    async def flush(self, key):
+        buffer = self.buffers.pop(key, None)
+        if not buffer:
+            return
+        monitors = buffer["monitors"]
+        # The most urgent rule in the window sets the reply and colour
+        top = max(monitors.values(), key=lambda rule: rule.priority)
+        embed = discord.Embed(description=get_response(top.category, ""), color=top.color)
+
+        if len(monitors) > 1:
+            groups = OrderedDict()
+            for name, rule in sorted(monitors.items(), key=lambda item: -item[1].priority):
+                groups.setdefault(rule.label, []).append(name)
+            embed.title = ", ".join(f"{len(names)} {label}" for label, names in groups.items())
+            for label, names in list(groups.items())[:EMBED_MAX_FIELDS]:
+                embed.add_field(
+                    name=truncate(label.capitalize(), EMBED_FIELD_NAME_MAX),
+                    value=truncate("\n".join(names), EMBED_FIELD_VALUE_MAX),
+                    inline=False
+                )
+        try:
+            await buffer["channel"].send(embed=embed)
+        except discord.HTTPException as e:
+            logger.error("Failed to send webhook summary: %s", e)
+
+    def close(self):
+        # The gateway is gone by now, so waiting summaries can't be sent
+        if self.buffers:
+            logger.warning("Dropping %d webhook alerts that were waiting to be summarised.", self.pending())
+        for buffer in self.buffers.values():
+            buffer["timer"].cancel()
+        self.buffers.clear()
+        for task in self.tasks:
+            task.cancel()
+
+webhook_aggregator = WebhookAggregator(WEBHOOK_AGGREGATE_WINDOW)
+
+def monitor_name(embed):
+    # Uptime Kuma puts the monitor in a "Service Name" field; fall back to the title
+    for field in embed.fields:
+        if field.name and "name" in field.name.lower() and field.value:
+            return field.value
+    return embed.title or embed.description or "Unknown"
 
-    spaced_out_check = re.search(r"\b([a-z])\s*([a-z])\s*([a-z])\s*([a-z])\s*([a-z])\b", cleaned_text)
-    if spaced_out_check and profanity.contains_profanity("".join(spaced_out_check.groups())):
-        return True
+# ----------------------------------------------------------------------------------
+# Profanity Filter
+# ----------------------------------------------------------------------------------
+def naughty_naughty(input_text: str) -> bool:
+    return get_profanity_matcher().contains(input_text)
 
-    return False
+# ----------------------------------------------------------------------------------
+# Batch Moderation
+# ----------------------------------------------------------------------------------
+moderation_executor = None
+
+def get_moderation_executor():
+    global moderation_executor
+    if moderation_executor is None:
+        # Spawned workers import moderation.py fresh instead of forking this
+        # process with its threads, sockets and SQLite connection
+        moderation_executor = ProcessPoolExecutor(max_workers=MODERATION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return moderation_executor
+
+def moderation_item(message):
+    if isinstance(message, str):
+        return None, message
+    if isinstance(message, tuple):
+        return message
+    return message.id, message.content or ""
+
+async def scan_messages(messages, chunk_size=2000):
+    # Accepts an iterable or async iterable of strings, (key, text) pairs or
+    # discord.Message objects, and returns every ModerationHit. Chunks are
+    # spread over a process pool while the rest of the stream is read in.
+    loop = asyncio.get_running_loop()
+    executor = get_moderation_executor()
+    in_flight = set()
+    hits = []
+    chunk = []
+
+    async def submit(chunk):
+        if len(in_flight) >= MODERATION_WORKERS * 2:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                in_flight.discard(future)
+                hits.extend(future.result())
+        in_flight.add(loop.run_in_executor(executor, scan_batch, chunk))
+
+    if hasattr(messages, "__aiter__"):
+        async for message in messages:
+            chunk.append(moderation_item(message))
+            if len(chunk) >= chunk_size:
+                await submit(chunk)
+                chunk = []
+    else:
+        for message in messages:
+            chunk.append(moderation_item(message))
+            if len(chunk) >= chunk_size:
+                await submit(chunk)
+                chunk = []
+    if chunk:
+        await submit(chunk)
+    for result in await asyncio.gather(*in_flight):
+        hits.extend(result)
+    return hits
+
+def close_moderation_executor():
+    if moderation_executor is not None:
+        moderation_executor.shutdown(wait=False, cancel_futures=True)
 
 # ----------------------------------------------------------------------------------
 # User Profile Management
 # ----------------------------------------------------------------------------------
-def load_profiles():
-    if os.path.exists(KNOWN_USERS):
-        if os.stat(KNOWN_USERS).st_size == 0:
-            print(f"Warning: {KNOWN_USERS} is empty.")
-            return {}
-        
+class ProfileStore(Mapping):
+    # Profiles live in SQLite (WAL mode, one row per user) with an in-memory
+    # copy for reads, so user_profiles.get() and `in` work like the old dict.
+    # Writes are single-row upserts/deletes run on a dedicated thread, and
+    # each one is its own transaction, so a crash can't corrupt other users.
+    def __init__(self, path, legacy_path):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.profiles = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiles")
+        self.conn = None
+
+    def open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS profiles (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self.conn.commit()
+        for user_id, data in self.conn.execute("SELECT user_id, data FROM profiles"):
+            try:
+                self.profiles[user_id] = json.loads(data)
+            except json.JSONDecodeError:
+                logger.error("Profile for %s contains invalid JSON, skipping it.", user_id)
+        if not self.profiles:
+            self._import_legacy()
+
+    def _import_legacy(self):
+        # One-time migration from known_users.json
+        if not os.path.exists(self.legacy_path) or os.path.getsize(self.legacy_path) == 0:
+            return
         try:
-            with open(KNOWN_USERS, "r") as file:
-                return json.load(file)
+            with open(self.legacy_path, "r") as file:
+                legacy = json.load(file)
         except json.JSONDecodeError:
-            print(f"Error: {KNOWN_USERS} contains invalid JSON.")
-            return {}
-    return {}
+            logger.error("%s contains invalid JSON, not importing it.", self.legacy_path)
+            return
+        if not legacy:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO profiles (user_id, data) VALUES (?, ?)",
+                [(user_id, json.dumps(profile)) for user_id, profile in legacy.items()]
+            )
+        self.profiles.update(legacy)
+        os.replace(self.legacy_path, self.legacy_path + ".migrated")
+        logger.info("Imported %d profiles from %s.", len(legacy), self.legacy_path)
+
+    def __getitem__(self, user_id):
+        return self.profiles[user_id]
+
+    def __iter__(self):
+        return iter(self.profiles)
 
+    def __len__(self):
+        return len(self.profiles)
 
-def save_profiles():
-    with open(KNOWN_USERS, "w") as file:
-        json.dump(user_profiles, file, indent=4)
+    def __contains__(self, user_id):
+        return user_id in self.profiles
+
+    def _upsert(self, user_id, data):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO profiles (user_id, data) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                (user_id, data)
+            )
+
+    def _delete(self, user_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM profiles WHERE user_id = ?", (user_id,))
+
+    async def upsert(self, user_id, profile):
+        self.profiles[user_id] = profile
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._upsert, user_id, json.dumps(profile))
+
+    async def delete(self, user_id):
+        self.profiles.pop(user_id, None)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._delete, user_id)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.conn.close()
 
 class ProfileView(discord.ui.View):
     def __init__(self):
@@ -147,14 +1345,13 @@ class ProfileModal(discord.ui.Modal, title="✨ Sign Net-chan's Book 'o Besties!
                 return
         
         user_id = str(interaction.user.id)
-        user_profiles[user_id] = {
+        await user_profiles.upsert(user_id, {
             "name": self.name.value,
             "favorite_color": self.favorite_color.value,
             "favorite_animal": self.favorite_animal.value,
             "favorite_food": self.favorite_food.value,
             "interests": self.interests.value,
-        }
-        save_profiles()
+        })
         await interaction.response.send_message(
             f"Profile created! ✨\n**Name:** {self.name.value}\n"
             f"**Favorite Color:** {self.favorite_color.value}\n"
@@ -164,215 +1361,818 @@ class ProfileModal(discord.ui.Modal, title="✨ Sign Net-chan's Book 'o Besties!
             ephemeral=True
         )
 
-user_profiles = load_profiles()
+user_profiles = ProfileStore(PROFILE_DB, KNOWN_USERS)
+
+# ----------------------------------------------------------------------------------
+# Cooldowns and Quotas
+# ----------------------------------------------------------------------------------
+class TokenBucket:
+    # Holds up to `capacity` tokens and regains one every `per` seconds
+    def __init__(self, capacity, per):
+        self.capacity = capacity
+        self.per = per
+
+    def new_state(self):
+        return {"tokens": self.capacity, "updated": time.time()}
+
+    def _refill(self, state, now):
+        state["tokens"] = min(self.capacity, state["tokens"] + (now - state["updated"]) / self.per)
+        state["updated"] = now
+
+    def available(self, state, now):
+        self._refill(state, now)
+        return int(state["tokens"])
+
+    def consume(self, state, now):
+        self._refill(state, now)
+        state["tokens"] -= 1
+
+    def refund(self, state, now):
+        self._refill(state, now)
+        state["tokens"] = min(self.capacity, state["tokens"] + 1)
+
+    def idle(self, state, now):
+        return self.available(state, now) >= self.capacity
+
+
+class SlidingWindow:
+    # Allows `limit` uses in any `window`-second stretch
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+
+    def new_state(self):
+        return {"hits": []}
+
+    def _prune(self, state, now):
+        hits = state["hits"]
+        cutoff = now - self.window
+        while hits and hits[0] <= cutoff:
+            hits.pop(0)
+
+    def available(self, state, now):
+        self._prune(state, now)
+        return self.limit - len(state["hits"])
+
+    def consume(self, state, now):
+        self._prune(state, now)
+        state["hits"].append(now)
+
+    def refund(self, state, now):
+        self._prune(state, now)
+        if state["hits"]:
+            state["hits"].pop()
+
+    def idle(self, state, now):
+        return self.available(state, now) >= self.limit
+
+
+class CooldownStore:
+    # Every rate limit in the bot, global or per user, lives here. Checks only
+    # touch memory; changes are written back to COOLDOWN_FILE in the
+    # background, so restarts and crash loops keep their quotas.
+    GLOBAL = "*"
+
+    def __init__(self, path):
+        self.path = path
+        self.limits = {}
+        self.states = {}
+        self.dirty = False
+
+    def open(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            try:
+                with open(self.path, "r") as file:
+                    self.states = json.load(file)
+            except json.JSONDecodeError as e:
+                logger.warning("Error decoding JSON from %s, starting with fresh cooldowns: %s", self.path, e)
+        for name in self.limits:
+            self.states.setdefault(name, {})
+
+    def define(self, name, limit):
+        self.limits[name] = limit
+        self.states.setdefault(name, {})
+
+    def _state(self, name, key):
+        states = self.states[name]
+        state = states.get(key)
+        if state is None:
+            state = states[key] = self.limits[name].new_state()
+        return state
+
+    def remaining(self, name, key=GLOBAL):
+        return self.limits[name].available(self._state(name, key), time.time())
+
+    def consume(self, name, key=GLOBAL):
+        self.limits[name].consume(self._state(name, key), time.time())
+        self.dirty = True
+
+    def try_acquire(self, name, key=GLOBAL):
+        if self.remaining(name, key) < 1:
+            return False
+        self.consume(name, key)
+        return True
+
+    def refund(self, name, key=GLOBAL):
+        # Gives back a use taken by try_acquire when the work didn't happen after all
+        self.limits[name].refund(self._state(name, key), time.time())
+        self.dirty = True
+
+    def snapshot(self):
+        # Fully recovered entries are dropped so the file only holds live limits
+        now = time.time()
+        snapshot = {}
+        for name, states in self.states.items():
+            limit = self.limits.get(name)
+            live = {
+                key: json.loads(json.dumps(state)) for key, state in states.items()
+                if limit is None or not limit.idle(state, now)
+            }
+            if live:
+                snapshot[name] = live
+        return snapshot
+
+    def _write(self, snapshot):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(snapshot, file)
+        os.replace(temp_path, self.path)
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, self.snapshot())
+        except OSError as e:
+            self.dirty = True
+            logger.error("Failed to save cooldowns: %s", e)
+
+    async def close(self):
+        await self.flush()
+
+cooldowns = CooldownStore(COOLDOWN_FILE)
+cooldowns.define("art", SlidingWindow(ART_DAILY_LIMIT, 24 * 3600))
+cooldowns.define("art_pool", SlidingWindow(ART_POOL_DAILY_BUDGET, 24 * 3600))
+cooldowns.define("pat", TokenBucket(1, 3600))
+cooldowns.define("wake", TokenBucket(1, 3600))
+if WEBHOOK_RATE_LIMIT:
+    cooldowns.define("webhook", TokenBucket(WEBHOOK_RATE_LIMIT, 60 / WEBHOOK_RATE_LIMIT))
+
+# ----------------------------------------------------------------------------------
+# Routing
+# ----------------------------------------------------------------------------------
+Route = namedtuple("Route", ["name", "events", "sources", "tags", "channels", "limited"])
+
+class RouteTable(WatchedJSONFile):
+    # routes.json sends events to channels, possibly in different guilds. A
+    # route matches when every criterion it lists matches (any of its events,
+    # any of its sources, any of its tags); all matching routes get a copy.
+    # Without a match, or without the file, everything goes to CHANNEL_ID.
+    def __init__(self, path):
+        self.by_event = {}
+        self.any_event = []
+        self.default_channels = (CHANNEL_ID,)
+        self.watched = frozenset((CHANNEL_ID,))
+        self.resolved = {}
+        super().__init__(path, {})
+
+    def _build(self, data):
+        if not isinstance(data, dict):
+            data = {}
+        by_event = {}
+        any_event = []
+        for index, spec in enumerate(data.get("routes", [])):
+            name = str(spec.get("name", f"route{index}"))
+            try:
+                channels = tuple(int(channel_id) for channel_id in spec["channels"])
+                rate = spec.get("rate_limit")
+                if rate:
+                    cooldowns.define(f"route:{name}", TokenBucket(rate["count"], rate["per"] / rate["count"]))
+            except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+                logger.warning("Route %s is missing channels or has a bad rate_limit, skipping it: %s", name, e)
+                continue
+            route = Route(
+                name,
+                frozenset(str(event).lower() for event in spec.get("events", [])),
+                frozenset(str(source) for source in spec.get("sources", [])),
+                frozenset(str(tag).lower() for tag in spec.get("tags", [])),
+                channels,
+                bool(rate),
+            )
+            if route.events:
+                for event in route.events:
+                    by_event.setdefault(event, []).append(route)
+            else:
+                any_event.append(route)
+
+        self.by_event = by_event
+        self.any_event = any_event
+        try:
+            self.default_channels = tuple(int(channel_id) for channel_id in data.get("default_channels", [CHANNEL_ID]))
+            self.watched = frozenset(int(channel_id) for channel_id in data.get("watch_channels", [CHANNEL_ID]))
+        except (TypeError, ValueError) as e:
+            logger.warning("Bad default_channels or watch_channels in %s, using CHANNEL_ID: %s", self.path, e)
+            self.default_channels = (CHANNEL_ID,)
+            self.watched = frozenset((CHANNEL_ID,))
+        self.resolved = {}
+
+    def resolve(self, event_type, source=None, tags=()):
+        # Results are memoized per (event, source, tags) until the file changes
+        self.refresh()
+        key = (event_type, source, tags)
+        routes = self.resolved.get(key)
+        if routes is None:
+            routes = tuple(
+                route for route in self.by_event.get(event_type, []) + self.any_event
+                if (not route.sources or source in route.sources)
+                and (not route.tags or not route.tags.isdisjoint(tags))
+            )
+            if len(self.resolved) >= ROUTE_CACHE_SIZE:
+                self.resolved.clear()
+            self.resolved[key] = routes
+        return routes
+
+    def channels_for(self, event_type, source=None, tags=(), default=None):
+        routes = self.resolve(event_type, source, tags)
+        if not routes:
+            return default or self.default_channels
+        channels = []
+        for route in routes:
+            if route.limited and not cooldowns.try_acquire(f"route:{route.name}"):
+                routes_dropped_total.inc(route.name)
+                continue
+            for channel_id in route.channels:
+                if channel_id not in channels:
+                    channels.append(channel_id)
+        return channels
+
+    def watches(self, channel_id):
+        self.refresh()
+        return channel_id in self.watched
+
+route_table = RouteTable(ROUTES_FILE)
+
+# ----------------------------------------------------------------------------------
+# Scheduler
+# ----------------------------------------------------------------------------------
+# Convert between timestamps and naive wall-clock time in the bot's timezone.
+# Without BOT_TIMEZONE the host's local time is used, which follows its DST rules.
+def local_time(timestamp=None):
+    if timestamp is None:
+        timestamp = time.time()
+    if BOT_TIMEZONE:
+        return datetime.fromtimestamp(timestamp, ZoneInfo(BOT_TIMEZONE)).replace(tzinfo=None)
+    return datetime.fromtimestamp(timestamp)
+
+def local_timestamp(moment):
+    if BOT_TIMEZONE:
+        return moment.replace(tzinfo=ZoneInfo(BOT_TIMEZONE)).timestamp()
+    return moment.timestamp()
+
+class CronTrigger:
+    # Standard five-field cron ("minute hour day month weekday") evaluated in
+    # the bot's timezone. Supports *, lists, ranges and steps; Sunday is 0 or 7.
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        ]
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(","):
+            part, slash, step = part.partition("/")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(value) for value in part.split("-"))
+            else:
+                start = end = int(part)
+                if slash:
+                    # "5/10" means from 5 to the end of the range in steps of 10
+                    end = high
+            step = int(step) if slash else 1
+            if step < 1:
+                raise ValueError(f"Cron field {field!r} needs a step of at least 1")
+            values.update(range(start, end + 1, step))
+        if not values or min(values) < low or max(values) > high:
+            raise ValueError(f"Cron field {field!r} is out of range {low}-{high}")
+        return values
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day
+        return day or weekday
+
+    def next_after(self, timestamp):
+        # Walks local wall-clock time field by field, so DST shifts land on
+        # the right local hour instead of drifting by the offset.
+        moment = local_time(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(100000):
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return local_timestamp(moment)
+        raise ValueError(f"Cron expression {self.expression!r} never fires")
+
+
+class JitterTrigger:
+    # Fires a random `low`..`high` seconds after the previous run. With
+    # `active_hours`, runs that would fall outside that local window are
+    # moved to the start of the next one.
+    def __init__(self, low, high, active_hours=None):
+        self.low = low
+        self.high = high
+        self.active_hours = active_hours
+
+    def next_after(self, timestamp):
+        candidate = timestamp + random.uniform(self.low, self.high)
+        if self.active_hours is None:
+            return candidate
+        start_hour, end_hour = self.active_hours
+        moment = local_time(candidate)
+        if start_hour <= moment.hour < end_hour:
+            return candidate
+        start = moment.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+        if moment.hour >= end_hour:
+            start += timedelta(days=1)
+        return local_timestamp(start)
+
+
+class ScheduledJob:
+    def __init__(self, name, trigger, func, catch_up):
+        self.name = name
+        self.trigger = trigger
+        self.func = func
+        self.catch_up = catch_up
+        self.next_fire = None
+        self.running = None
+
+
+class Scheduler:
+    # One task drives every periodic job from a heap ordered by next fire
+    # time. Fire times are wall-clock timestamps saved to SCHEDULE_FILE, so
+    # after a restart jobs keep their place, and a job that was due while the
+    # bot was down runs once straight away if it asked for catch-up.
+    def __init__(self, path):
+        self.path = path
+        self.jobs = {}
+        self.heap = []
+        self.counter = 0
+        self.saved = {}
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def open(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            try:
+                with open(self.path, "r") as file:
+                    self.saved = json.load(file)
+            except json.JSONDecodeError as e:
+                logger.warning("Error decoding JSON from %s, rescheduling every job: %s", self.path, e)
+
+    def add(self, name, trigger, func, catch_up=True):
+        job = ScheduledJob(name, trigger, func, catch_up)
+        now = time.time()
+        saved = self.saved.get(name)
+        if saved is None:
+            job.next_fire = trigger.next_after(now)
+        elif saved > now:
+            job.next_fire = saved
+        elif catch_up:
+            logger.info("Job %s was due while I was asleep, running it now.", name)
+            job.next_fire = now
+        else:
+            job.next_fire = trigger.next_after(now)
+        self.jobs[name] = job
+        self._push(job)
+        return job
+
+    def _push(self, job):
+        self.counter += 1
+        heapq.heappush(self.heap, (job.next_fire, self.counter, job))
+        self.wakeup.set()
+
+    def next_runs(self):
+        return sorted((job.next_fire, name) for name, job in self.jobs.items())
+
+    async def _run_job(self, job):
+        try:
+            await job.func()
+        except Exception:
+            logger.exception("Scheduled job %s failed", job.name)
+
+    async def run(self):
+        while True:
+            if not self.heap:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            next_fire, _, job = self.heap[0]
+            delay = next_fire - time.time()
+            if delay > 0:
+                # Sleep in bounded steps so clock jumps and suspends are noticed
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), min(delay, SCHEDULER_MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.heap)
+            if job.running is None or job.running.done():
+                job.running = asyncio.get_running_loop().create_task(self._run_job(job))
+            else:
+                logger.warning("Job %s is still running, skipping this run.", job.name)
+            job.next_fire = job.trigger.next_after(max(next_fire, time.time()))
+            self._push(job)
+            await self.save()
+
+    async def save(self):
+        snapshot = {name: job.next_fire for name, job in self.jobs.items()}
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, snapshot)
+        except OSError as e:
+            logger.error("Failed to save schedule: %s", e)
+
+    def _write(self, snapshot):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(snapshot, file)
+        os.replace(temp_path, self.path)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        await self.save()
+
+scheduler = Scheduler(SCHEDULE_FILE)
 
 # ----------------------------------------------------------------------------------
-# Delay Management
+# Assets
 # ----------------------------------------------------------------------------------
-def load_delay_time(file_path):
-    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+class Asset:
+    def __init__(self, data, filename, mtime):
+        self.data = data
+        self.filename = filename
+        self.mtime = mtime
+        self.checked = time.monotonic()
+        self.url = None
+        self.url_expires = 0.0
+
+
+class AssetRegistry:
+    # Bot images are read (and optionally transcoded or shrunk) once. Every
+    # send wraps the same bytes object in a BytesIO, which shares the buffer
+    # instead of copying it. Once an image has been uploaded, its Discord CDN
+    # URL is reused until the signed link's expiry, so repeats send no bytes.
+    CHECK_INTERVAL = 2.0
+    URL_MARGIN = 3600
+
+    def __init__(self, directory, output_format, max_size):
+        self.directory = directory
+        self.output_format = output_format
+        self.max_size = max_size
+        self.assets = {}
+
+    @staticmethod
+    def key(path):
+        return os.path.normpath(path)
+
+    def _load(self, path):
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, "rb") as f:
+            data = f.read()
+        filename = os.path.basename(path)
+        output_format = self.output_format
+        if output_format == "original" and self.max_size:
+            from PIL import Image
+            output_format = (Image.open(io.BytesIO(data)).format or "").lower()
+        if output_format in ART_FORMATS:
+            # Bypasses encode_art's cache; that is sized for generated art
+            data, extension = encode_art.__wrapped__(data, output_format, ART_OUTPUT_QUALITY, self.max_size)
+            filename = f"{os.path.splitext(filename)[0]}.{extension}"
+        return Asset(data, filename, mtime)
+
+    def preload(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.lower().endswith(ASSET_EXTENSIONS):
+                    path = self.key(os.path.join(root, name))
+                    try:
+                        self.assets[path] = self._load(path)
+                    except Exception as e:
+                        # Not just OSError: PIL raises its own errors for corrupt images
+                        logger.warning("Failed to load image %s: %s", path, e)
+        logger.info("Loaded %d images (%.1f MB)", len(self.assets), sum(len(asset.data) for asset in self.assets.values()) / (1024 * 1024))
+
+    def get(self, path):
+        path = self.key(path)
+        asset = self.assets.get(path)
+        now = time.monotonic()
+        if asset is not None and now - asset.checked < self.CHECK_INTERVAL:
+            return asset
         try:
-            with open(file_path, 'r') as file:
-                data = json.load(file)
-                last_time_str = data.get('last_time')
-                if last_time_str:
-                    return datetime.fromisoformat(last_time_str)
-                else:
-                    print(f"Key 'last_time' not found in {file_path}")
-                    return None
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON from {file_path}: {e}")
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            if asset is None:
+                raise
+            mtime = asset.mtime
+        if asset is None or mtime != asset.mtime:
+            logger.info("Loading image %s", path)
+            asset = self.assets[path] = self._load(path)
+        asset.checked = now
+        return asset
+
+    def attach(self, embed, path):
+        # Points the embed's image at the asset and returns the file to send, if any
+        asset = self.get(path)
+        if asset.url and time.time() < asset.url_expires - self.URL_MARGIN:
+            embed.set_image(url=asset.url)
             return None
-    else:
-        print(f"File {file_path} does not exist or is empty.")
-        return None
+        embed.set_image(url=f"attachment://{asset.filename}")
+        return discord.File(io.BytesIO(asset.data), filename=asset.filename)
 
-def save_delay_time(file_path):
-    last_time = datetime.now()
-    with open(file_path, 'w') as file:
-        json.dump({"last_time": last_time.isoformat()}, file)
-
-def load_last_art_time():
-    return load_delay_time(ART_DELAY_FILE)
-
-def save_last_art_time():
-    if not os.path.exists(ART_DELAY_FILE):
-        with open(ART_DELAY_FILE, "w") as file:
-            json.dump({}, file)
-    save_delay_time(ART_DELAY_FILE)
-
-def load_last_wake_time():
-    if not os.path.exists(WAKE_DELAY_FILE):
-        with open(WAKE_DELAY_FILE, "w") as file:
-            json.dump({}, file)
-    last_time = load_delay_time(WAKE_DELAY_FILE)
-    if last_time is None:
-        print("No previous wake time found, initializing to None.")
-    return last_time
-
-def save_last_wake_time():
-    if not os.path.exists(WAKE_DELAY_FILE):
-        with open(WAKE_DELAY_FILE, "w") as file:
-            json.dump({}, file)
-    save_delay_time(WAKE_DELAY_FILE)
-    print(f"Saved last_wake_message_time to file.")
-
-def is_new_day(last_timestamp):
-    if not last_timestamp:
-        return True
-    
-    last_date = last_timestamp.date()
-    current_date = datetime.now().date()
-    
-    return current_date > last_date
+    def remember(self, path, message):
+        asset = self.assets.get(self.key(path))
+        if asset is None:
+            return
+        # Discord reports the CDN link of an attachment:// embed image on the
+        # embed itself, and may leave `attachments` empty
+        url = message.embeds[0].image.url if message.embeds else None
+        if not url or not url.startswith("https://"):
+            if not message.attachments:
+                return
+            url = message.attachments[0].url
+        expires = parse_qs(urlsplit(url).query).get("ex")
+        try:
+            asset.url_expires = int(expires[0], 16) if expires else time.time() + ASSET_URL_TTL
+        except ValueError:
+            return
+        asset.url = url
+
+assets = AssetRegistry(ASSETS_DIR, ASSET_OUTPUT_FORMAT, ASSET_MAX_SIZE)
+
+def log_preload_result(future):
+    # Runs when the startup preload finishes, so its errors don't go unseen
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Image preload failed", exc_info=future.exception())
+
+async def send_asset(destination, embed, path):
+    file = assets.attach(embed, path)
+    message = await destination.send(embed=embed, file=file)
+    if file is not None:
+        assets.remember(path, message)
+    return message
 
 # ----------------------------------------------------------------------------------
 # Music Handling
 # ----------------------------------------------------------------------------------
-def get_song():
-    if os.path.exists('./responses.json'):
-        with open('./responses.json', 'r') as f:
-            json_data = json.load(f)
-            return(random.choice(json_data))
-    else:
-        return(None)
+Track = namedtuple("Track", ["title", "artist", "image", "link"])
+
+class ShuffleBag:
+    # Hands out every item once in random order before any repeats, and
+    # never the same item twice in a row across refills.
+    def __init__(self, items):
+        self.items = list(items)
+        self.bag = []
+        self.last = None
+
+    def next(self):
+        if not self.bag:
+            self.bag = self.items[:]
+            random.shuffle(self.bag)
+            if len(self.bag) > 1 and self.bag[-1] == self.last:
+                self.bag[0], self.bag[-1] = self.bag[-1], self.bag[0]
+        self.last = self.bag.pop()
+        return self.last
+
+
+class MusicCatalog(WatchedJSONFile):
+    def __init__(self, path):
+        self.tracks = []
+        self.by_artist = {}
+        self.by_title = {}
+        self.bags = {}
+        super().__init__(path, [])
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(str(text).lower().split())
+
+    def _build(self, data):
+        tracks = []
+        by_artist = {}
+        by_title = {}
+        for entry in data if isinstance(data, list) else []:
+            if not isinstance(entry, dict) or not entry.get("title") or not entry.get("artist"):
+                continue
+            track = Track(str(entry["title"]), str(entry["artist"]), entry.get("image"), entry.get("link", ""))
+            index = len(tracks)
+            tracks.append(track)
+            by_artist.setdefault(self.normalize(track.artist), []).append(index)
+            by_title.setdefault(self.normalize(track.title), []).append(index)
+        self.tracks = tracks
+        self.by_artist = by_artist
+        self.by_title = by_title
+        # Bags are built lazily, one for the whole catalog and one per lookup
+        self.bags = {}
+
+    def _draw(self, key, indexes):
+        bag = self.bags.get(key)
+        if bag is None:
+            bag = self.bags[key] = ShuffleBag(indexes)
+        return self.tracks[bag.next()]
+
+    def pick(self, query=None):
+        # A random track, or one by the given artist (or with the given
+        # title); None if there is nothing to pick from.
+        self.refresh()
+        if not query:
+            if not self.tracks:
+                return None
+            return self._draw(None, range(len(self.tracks)))
+        query = self.normalize(query)
+        indexes = self.by_artist.get(query) or self.by_title.get(query)
+        if not indexes:
+            return None
+        return self._draw(query, indexes)
+
+music_catalog = MusicCatalog(MUSIC_FILE)
 
 # ==================================================================================
 # DISCORD BOT EVENTS
 # ==================================================================================
+@bot.event
+async def on_connect():
+    startup_mark("gateway connected")
+
 @bot.event
 async def on_ready():
-    global last_wake_message_time
-    global user_profiles
-    user_profiles = load_profiles()
-    print(f"Net-chan is ready! Logged in as {bot.user}")
-
-    last_wake_message_time = load_last_wake_time()
-    print(f"Loaded last_wake_message_time: {last_wake_message_time}")
-
-    bot.loop.create_task(send_positive_messages())
-
-    current_time = datetime.now()
-    print(f"Current time: {current_time}")
-
-    async with wake_message_lock:
-        if last_wake_message_time is None or (current_time - last_wake_message_time) > timedelta(hours=1):
-            channel = bot.get_channel(CHANNEL_ID)
-            if channel:
-                wake_message = get_response("wake", "")
-                embed = discord.Embed(description=wake_message, color=discord.Color.blue())
-                file=discord.File('./images/net-chan-sleepy.png', filename="net-chan-sleepy.png")
-                embed.set_image(url="attachment://net-chan-sleepy.png")
-                await channel.send(embed=embed, file=file)
-                last_wake_message_time = current_time
-                save_last_wake_time()
-                print(f"Sent wake message and updated last_wake_message_time to: {last_wake_message_time}")
+    logger.info("Net-chan is ready! Logged in as %s", bot.user)
+    gateway_ready.set()
+    if PROFILE_STARTUP and not any(label == "ready" for label, _ in startup_marks):
+        startup_mark("ready")
+        startup_report()
+    if MODERATE_MESSAGES:
+        asyncio.get_running_loop().run_in_executor(None, get_profanity_matcher)
+
+
+    # At most one wake message an hour, even if the bot is restarting in a loop
+    channel = bot.get_channel(CHANNEL_ID)
+    if channel and cooldowns.try_acquire("wake"):
+        # Saved straight away: a restart before the next periodic flush would send it again
+        await cooldowns.flush()
+        wake_message = get_response("wake", "")
+        embed = discord.Embed(description=wake_message, color=discord.Color.blue())
+        await send_asset(channel, embed, "./images/net-chan-sleepy.png")
+        logger.info("Sent wake message.")
 
 @bot.event
-async def on_message(message):
-    global last_response_time
-    global webhook_log
+async def on_disconnect():
+    gateway_ready.clear()
 
+@bot.event
+async def on_resumed():
+    gateway_ready.set()
+
+@bot.event
+async def on_command(ctx):
+    ctx.started = time.perf_counter()
+
+@bot.event
+async def on_command_completion(ctx):
+    started = getattr(ctx, "started", None)
+    if started is not None:
+        record_command_timing(ctx.command.qualified_name, time.perf_counter() - started)
+
+@bot.event
+async def on_message(message):
     if message.author == bot.user:
         return
 
     await bot.process_commands(message)
 
-    webhook_user_id = int(os.getenv("WEBHOOK_BOT_ID"))
-
-    if message.channel.id == CHANNEL_ID and message.author.id == webhook_user_id:
-        current_time = asyncio.get_event_loop().time()
-
-        if last_response_time and current_time - last_response_time < 60:
-            return 
+    if MODERATE_MESSAGES and not message.author.bot and naughty_naughty(message.content):
+        record_event("moderation", "profanity", f"{message.author} in #{message.channel}")
+        await message.reply(
+            "Oopsie~! That message has some bad words in it.\n(｡•́︿•̀｡)\nLet's keep it cute, okay?",
+            mention_author=False
+        )
 
-        last_response_time = current_time
-        await asyncio.sleep(2)
+    webhook_user_id = int(os.getenv("WEBHOOK_BOT_ID"))
 
-        print(f"Message author: {message.author}")
-        print(f"Message content: {message.content}")
-        print(f"Message embeds: {message.embeds}")
+    if message.author.id == webhook_user_id and route_table.watches(message.channel.id):
+        if LOG_DEBUG_DUMPS:
+            logger.debug("Webhook message", extra={"author": str(message.author), "content": message.content, "embeds": [embed.to_dict() for embed in message.embeds]})
 
-        embed = None
-        reply = None
+        parts = message_parts(message)
+        if EMBED_CORPUS_FILE:
+            record_embed_corpus(parts)
+        rule = webhook_rules.classify(parts)
+        category = rule.category
 
         if message.embeds: 
             embed = message.embeds[0]
             embed_title = embed.title.lower() if embed.title else ""
-
-            for field in embed.fields:
-                print(f"Field Name: {field.name}, Value: {field.value}")
-
             log_message = f"{embed_title}: {embed.description if embed.description else 'No description'}"
-            print(log_message)
-            webhook_log.append(log_message)
-
-            if "up" in embed_title:
-                reply = get_response("kuma", "")
-                color = discord.Color.green()
-            elif "down" in embed_title:
-                reply = get_response("fire", "")
-                color = discord.Color.red()
-            else:
-                reply = get_response("unraid", "")
-                color = discord.Color.purple()
+            monitor = monitor_name(embed)
         else:
             message_content = message.content.strip().lower()
-            print(f"Message content after cleaning: {message_content}")
-
-            if any(keyword in message_content for keyword in ['error', 'down', 'errors']):
-                reply = get_response("fire", "")
-                color = discord.Color.red()
-            elif 'up' in message_content:
-                reply = get_response("kuma", "")
-                color = discord.Color.green()
-            else:
-                reply = get_response("unraid", "")
-                color = discord.Color.purple()
+            log_message = message_content
+            monitor = message.content.strip()[:100] or "Unknown"
 
-            webhook_log.append(message_content)
-
-        if reply:
-            embed = discord.Embed(description=reply, color=color)
-            await message.channel.send(embed=embed)
+        record_event("discord", category, log_message)
+        logger.info("Matched rule %s -> %s", rule.name, category, extra={"detail": log_message, "sample": "discord-webhook"})
+        webhook_aggregator.add(message.author.id, message.channel, monitor, rule)
 
 # ==================================================================================
 # BACKGROUND TASKS
 # ==================================================================================
-async def send_positive_messages():
+async def send_affirmation():
     await bot.wait_until_ready()
-    
-    while not bot.is_closed():
-        now = datetime.now()
-        daytime_start = now.replace(hour=8, minute=0, second=0, microsecond=0)
-        daytime_end = now.replace(hour=20, minute=0, second=0, microsecond=0)
+    if is_quiet_hours():
+        return
 
-        channel = bot.get_channel(AFFIRM_ID)
-        
-        if daytime_start <= now <= daytime_end:
-            if channel:
-                try:
-                    positive_message = get_response("affirmations", "")
-                    embed = discord.Embed(description=positive_message, color=discord.Color.purple())
-                    await channel.send(embed=embed)
-                except Exception as e:
-                    print(f"Failed to send affirmation message: {e}")
-            wait_time = random.randint(6 * 3600, 12 * 3600)
-            await asyncio.sleep(wait_time)
-        else:
-            if now < daytime_start:
-                wait_for_daytime = (daytime_start - now).seconds
-            else:
-                wait_for_daytime = (daytime_start + timedelta(days=1) - now).seconds
+    positive_message = get_response("affirmations", "")
+    embed = discord.Embed(description=positive_message, color=discord.Color.purple())
+    channels = [bot.get_channel(channel_id) for channel_id in route_table.channels_for("affirmations", default=(AFFIRM_ID,))]
+    results = await asyncio.gather(
+        *(channel.send(embed=embed) for channel in channels if channel),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error("Failed to send affirmation message: %s", result)
+
+def is_quiet_hours(now=None):
+    now = now or local_time()
+    return not DAYTIME_START_HOUR <= now.hour < DAYTIME_END_HOUR
+
+async def fill_art_pool():
+    # Uses the overnight lull to pre-generate art so !art can answer straight
+    # away. Each run adds one picture: the shared pool first, then one
+    # personalized slot per registered user, stopping at the daily API budget.
+    await bot.wait_until_ready()
+    if not is_quiet_hours():
+        return
 
-            await asyncio.sleep(wait_for_daytime)
+    user_id = None
+    if len(art_pool.generic) < ART_POOL_SIZE:
+        prompt = build_art_prompt(None)
+    else:
+        user_id = next((uid for uid in list(user_profiles.keys()) if uid not in art_pool.personal), None)
+        if user_id is None:
+            return
+        prompt = build_art_prompt(user_profiles.get(user_id))
 
-async def reset_praise_counter():
-    global praise_counter
-    while True:
-        await asyncio.sleep(60 * 60)
-        praise_counter = 1
-        print("Praise counter reset to 1.")
+    if not cooldowns.try_acquire("art_pool"):
+        return
+    reserved = True
+    try:
+        result = await get_art_image(prompt)
+        if result is not None:
+            image_data, from_cache = result
+            reserved = from_cache
+            art_pool.add(prompt, image_data, user_id)
+            logger.info("Pre-generated art for %s", user_id or "the pool", extra={"prompt": prompt})
+    finally:
+        # Cached pictures and failed requests don't count against the budget
+        if reserved:
+            cooldowns.refund("art_pool")
+
+async def prune_art_cache():
+    # Entries only expire when the cache is touched, so sweep it nightly
+    art_cache._evict()
+
+def schedule_jobs():
+    scheduler.add("affirmations", JitterTrigger(6 * 3600, 12 * 3600, (DAYTIME_START_HOUR, DAYTIME_END_HOUR)), send_affirmation)
+    scheduler.add("art_pool", JitterTrigger(ART_POOL_INTERVAL, ART_POOL_INTERVAL), fill_art_pool, catch_up=False)
+    scheduler.add("art_cache_prune", CronTrigger("30 4 * * *"), prune_art_cache)
+    scheduler.add("cooldown_flush", JitterTrigger(COOLDOWN_FLUSH_INTERVAL, COOLDOWN_FLUSH_INTERVAL), cooldowns.flush, catch_up=False)
 
 # ==================================================================================
 # CUSTOM HELP COMMAND
@@ -387,11 +2187,14 @@ class CustomHelpCommand(commands.HelpCommand):
     "✨ `!register` - Create a sparkling profile with me! •ᴗ•\n"
     "✨ `!whoami` - Check my memory about you! ╰ (´꒳`) ╯ \n"
     "✨ `!deleteme` - Delete your profile! 💔 (╥﹏╥)\n"
-    "✨ `!log` - Check the server event logs! ʕ•ᴥ•ʔ\n"
+    "✨ `!log [event] [count] [since 1h]` - Check the server event logs! ʕ•ᴥ•ʔ\n"
     "✨ `!art` - I'll make a cute picture! (◠﹏◠✿)\n"
+    "✨ `!stats` - Peek at my art cache and event stats! (๑•̀ㅂ•́)و✧\n"
+    "✨ `!scan [count]` - I'll check this channel for bad words! (｀・ω・´)\n"
+    "✨ `!perf [on|off|reset]` - My owner can see what slows me down! (・・ )?\n"
     "✨ `!cheer` - I'll cheer you on! ヽ(•‿•)ノ\n"
     "✨ `!pat` - Hey, I'm working! (｡•̀︿•́｡)\n"
-    "✨ `!music` - See what Net-chan's playing right now! (>▽<) 🎶"
+    "✨ `!music [artist]` - See what Net-chan's playing right now! (>▽<) 🎶"
 )
 
         
@@ -449,8 +2252,8 @@ async def whoami(ctx):
 async def deleteme(ctx):
     user_id = str(ctx.author.id)
     if user_id in user_profiles:
-        del user_profiles[user_id]
-        save_profiles()
+        await user_profiles.delete(user_id)
+        art_pool.discard(user_id)
         await ctx.send("Uuuuugh~! (╥﹏╥) Net-chan's deleting profiles... Soooo sad... Your profile is gone now! 💔💻💨")
     else:
         await ctx.send("Eh? (・_・;) You don't have a profile to delete, silly~! Maybe it's hiding somewhere? ( ´•̥̥̥ω•̥̥̥` )")
@@ -460,29 +2263,94 @@ async def deleteme(ctx):
 # Log Commands
 # ----------------------------------------------------------------------------------
 @bot.command()
-async def log(ctx):
-    global webhook_log
-    print(webhook_log) 
-    if not webhook_log:
+async def log(ctx, *args):
+    # Usage: !log [event_type] [count] [since <duration>], e.g. !log backup 20 or !log since 1h
+    event_type = None
+    limit = 5
+    since = None
+    args = list(args)
+    while args:
+        arg = args.pop(0).lower()
+        if arg == "since" and args:
+            seconds = parse_duration(args.pop(0))
+            if seconds is None:
+                await ctx.send("Eh? (・_・;) I only understand times like `30m`, `1h` or `2d`!")
+                return
+            since = time.time() - seconds
+            limit = MAX_LOG_SIZE
+        elif arg.isdigit():
+            limit = max(1, min(int(arg), MAX_LOG_SIZE))
+        else:
+            event_type = arg
+
+    records = event_log.query(event_type=event_type, limit=limit, since=since)
+    if not records:
         log_text = "No recent webhooks received. (╯︵╰,)"
         border_color = discord.Color.red()
     else:
-        recent_logs = [str(entry) for entry in webhook_log[-5:]]
-        log_text = "\n".join(recent_logs)
+        lines = [
+            f"`{datetime.fromtimestamp(record.timestamp).strftime('%m-%d %H:%M')}` {record.event_type}: {record.message}"
+            for record in records
+        ]
+        log_text = "\n".join(lines)
+        if len(log_text) > 4000:
+            log_text = "…\n" + log_text[-4000:].split("\n", 1)[-1]
         border_color = discord.Color.green()
 
-    embed = discord.Embed(title="Webhook Log", description=log_text, color=border_color)
+    title = "Webhook Log" if event_type is None else f"Webhook Log: {event_type}"
+    embed = discord.Embed(title=title, description=log_text, color=border_color)
+    embed.set_footer(text=f"Notifications waiting to send: {outbound_depth()}")
     await ctx.send(embed=embed)
 
+# ----------------------------------------------------------------------------------
+# Moderation Commands
+# ----------------------------------------------------------------------------------
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def scan(ctx, limit: int = 1000):
+    limit = max(1, min(limit, MODERATION_SCAN_MAX))
+    working_message = await ctx.send(embed=discord.Embed(
+        description=f"Okie~! Net-chan is reading through the last {limit} messages... 🔍 (｀・ω・´)",
+        color=discord.Color.blue()
+    ))
+
+    scanned = 0
+
+    async def history():
+        nonlocal scanned
+        async for message in ctx.channel.history(limit=limit, before=ctx.message):
+            if message.author == bot.user:
+                continue
+            scanned += 1
+            yield message.id, message.content
+
+    hits = await scan_messages(history())
+    flagged = sorted({hit.key for hit in hits}, reverse=True)
+
+    if not flagged:
+        embed = discord.Embed(
+            description=f"All clean! I checked {scanned} messages and didn't find any bad words~! ✨(｡♥‿♥｡)",
+            color=discord.Color.green()
+        )
+    else:
+        links = "\n".join(ctx.channel.get_partial_message(message_id).jump_url for message_id in flagged[:10])
+        embed = discord.Embed(
+            description=f"Uh-oh! (╯︵╰,) {len(flagged)} of {scanned} messages have bad words in them!\n\n{links}",
+            color=discord.Color.red()
+        )
+        if len(flagged) > 10:
+            embed.set_footer(text=f"...and {len(flagged) - 10} more")
+    await working_message.edit(embed=embed)
+
 # ----------------------------------------------------------------------------------
 # Interaction Commands
 # ----------------------------------------------------------------------------------
 @bot.command()
 async def pat(ctx):
-    global praise_counter
     pat_image = './images/net-chan-embarassed.png'
 
-    if praise_counter == 0:
+    # Each person gets one happy pat an hour; after that she's annoyed
+    if not cooldowns.try_acquire("pat", str(ctx.author.id)):
         pat_reply = get_response("pat_annoyed", "")
         pat_image = './images/net-chan-angry.png'
         embed_color = discord.Color.red()
@@ -491,12 +2359,7 @@ async def pat(ctx):
         embed_color = discord.Color.green()
     
     embed = discord.Embed(description=pat_reply, color=embed_color)
-    file = discord.File(pat_image, filename="net-chan.png")
-    embed.set_image(url="attachment://net-chan.png")
-
-    await ctx.send(embed=embed, file=file)
-    
-    praise_counter = 0
+    await send_asset(ctx, embed, pat_image)
 
 @bot.command()
 async def info(ctx):
@@ -540,7 +2403,7 @@ async def info(ctx):
         inline=False
     )
 
-    await ctx.send(embed=embed, file=discord.File('./images/net-chan.png'))
+    await send_asset(ctx, embed, "./images/net-chan.png")
 
 @bot.command()
 async def cheer(ctx):
@@ -552,100 +2415,281 @@ async def cheer(ctx):
 # ----------------------------------------------------------------------------------
 # Art Command
 # ----------------------------------------------------------------------------------
+CUTE_NOUNS = ["kitten", "puppy", "bunny", "baby", "cloud", "star", "bear", "butterfly", "kittens", "cupcake", "flower", "chick", "cookie", "birdie", "deer", "panda", "frog", "koala", "rainbow", "daisy", "lamb", "honeybee", "squirrel", "sunflower", "pony", "snowflake", "pup", "sparkle", "dream", "lollipop", "rose", "buttercup", "jellybean", "baby chick", "puddle", "treasure", "snail"]
+CUTE_ADJECTIVES = ["fluffy", "sparkly", "adorable", "sweet", "charming", "gentle", "playful", "soft", "lovely", "cute", "happy", "bright", "snuggly", "fuzzy", "cheerful", "whimsical", "delightful", "tender", "shiny", "rosy", "tasty", "warm", "peppy", "breezy", "magical", "sweetheart", "fluffy", "giddy", "colorful", "lovable", "bouncy", "calm", "pretty", "cozy", "fresh", "gentle", "glowy", "smiley", "sparkling", "twin", "friendly", "graceful", "carefree", "dazzling", "snug", "dreamy", "sunny", "puffy", "jolly", "mellow"]
+CUTE_OBJECTS = ["heart", "balloon", "cupcake", "cookie", "star", "cloud", "teddy bear", "rainbow", "flower", "blanket", "butterfly", "headband", "whisk", "paintbrush", "camera", "bookmark", "gloves", "pajamas", "purse", "necklace", "hat", "scarf", "bowtie", "sticker", "guitar", "mug", "pencil case", "ball", "glitter", "cup", "note", "book", "bottle", "jewelry", "pen", "notepad", "sweets", "keychain", "coin", "bracelet", "flowerpot", "diary", "mirror", "bottle","snow globe", "painting", "clock"]
+
+ART_API_URL = "https://api.venice.ai/api/v1/image/generate"
+ART_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=120, connect=10)
+ART_FORMATS = {"png": ("PNG", "png"), "jpeg": ("JPEG", "jpg"), "jpg": ("JPEG", "jpg"), "webp": ("WEBP", "webp")}
+if ART_OUTPUT_FORMAT != "original" and ART_OUTPUT_FORMAT not in ART_FORMATS:
+    logger.warning("Unknown ART_OUTPUT_FORMAT %r, sending the original image instead.", ART_OUTPUT_FORMAT)
+    ART_OUTPUT_FORMAT = "original"
+art_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="art")
+http_session = None
+
+def get_http_session():
+    # One pooled session for all outgoing API calls, created on first use so
+    # it binds to the running loop.
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            timeout=ART_REQUEST_TIMEOUT,
+            connector=aiohttp.TCPConnector(limit=10),
+        )
+    return http_session
+
+async def close_http_session():
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+
+def build_art_prompt(profile):
+    #Customize art with user profile if available
+    if profile and random.random() >= 0.7:
+        adjective = profile["favorite_color"]
+    else:
+        adjective = random.choice(CUTE_ADJECTIVES)
+
+    if profile and random.random() >= 0.7:
+        noun = profile["favorite_animal"]
+    else:
+        noun = random.choice(CUTE_NOUNS)
+
+    if profile and random.random() >= 0.7:
+        object_ = profile["favorite_food"]
+    else:
+        object_ = random.choice(CUTE_OBJECTS)
+
+    return f"a {adjective} {noun} with a {object_} in a very kawaii style"
+
+def build_art_payload(prompt):
+    return {
+        "model": "flux-dev",
+        "prompt": prompt,
+        "style_preset": "Anime",
+        "height": 600,
+        "width": 600,
+        "steps": 20,
+        "cfg_scale": 7.5,
+        "seed": 123456789,
+        "lora_strength": 50,
+        "safe_mode": True,
+        "return_binary": False,
+        "hide_watermark": True,
+        "format": "webp",
+        "embed_exif_metadata": False,
+    }
+
+async def request_art(payload):
+    # Returns the base64 image string, or None if the API refused the request
+    headers = {
+        "Authorization": f"Bearer {os.getenv('VENICE_API')}",
+        "Content-Type": "application/json"
+    }
+    async with get_http_session().post(ART_API_URL, json=payload, headers=headers) as response:
+        if response.status != 200:
+            logger.warning("Art API returned status %d", response.status)
+            return None
+        response_data = await response.json()
+
+    if "images" in response_data and response_data["images"]:
+        # The first image in the array contains the base64 data
+        return response_data["images"][0]
+    raise ValueError("No images found in the response")
+
+@functools.lru_cache(maxsize=16)
+def encode_art(image_data, output_format, quality, max_size):
+    # Returns (bytes, extension). "original" hands back the source bytes as-is;
+    # anything else is transcoded, and repeat encodes of the same image are cached.
+    if output_format == "original":
+        return image_data, "webp"
+    from PIL import Image
+    pil_format, extension = ART_FORMATS[output_format]
+    image = Image.open(io.BytesIO(image_data))
+    if max_size and max(image.size) > max_size:
+        image.thumbnail((max_size, max_size))
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    with io.BytesIO() as image_file:
+        if pil_format == "PNG":
+            image.save(image_file, format=pil_format, optimize=False)
+        else:
+            image.save(image_file, format=pil_format, quality=quality)
+        return image_file.getvalue(), extension
+
+def prepare_art(image_data):
+    # Runs in art_executor: transcoding is CPU-bound
+    return encode_art(image_data, ART_OUTPUT_FORMAT, ART_OUTPUT_QUALITY, ART_OUTPUT_MAX_SIZE)
+
+class ArtCache:
+    # Content-addressed store of generated images. The file name is a hash of
+    # the generation payload, so the same prompt and settings always map to
+    # the same file. An in-memory LRU index tracks size and age for eviction.
+    def __init__(self, directory, max_bytes, max_age):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".img"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for created, key, size in sorted(entries):
+            self.index[key] = (size, created)
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def key(payload):
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.img")
+
+    def _expired(self, created):
+        return self.max_age and time.time() - created > self.max_age
+
+    async def get(self, key):
+        entry = self.index.get(key)
+        if entry is None or self._expired(entry[1]):
+            self.misses += 1
+            return None
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(art_executor, self._read, key)
+        except OSError:
+            self._forget(key)
+            self.misses += 1
+            return None
+        self.index.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def _read(self, key):
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    async def put(self, key, data):
+        try:
+            await asyncio.get_running_loop().run_in_executor(art_executor, self._write, key, data)
+        except OSError as e:
+            logger.warning("Failed to cache art %s: %s", key, e)
+            return
+        if key in self.index:
+            self.total_bytes -= self.index[key][0]
+        self.index[key] = (len(data), time.time())
+        self.index.move_to_end(key)
+        self.total_bytes += len(data)
+        self._evict()
+
+    def _write(self, key, data):
+        temp_path = self.path(key) + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self.path(key))
+
+    def _forget(self, key):
+        size, _ = self.index.pop(key)
+        self.total_bytes -= size
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        # Least recently used entries go first, along with anything too old
+        for key, (size, created) in list(self.index.items()):
+            if self.total_bytes <= self.max_bytes and not self._expired(created):
+                break
+            self._forget(key)
+        for key in [key for key, (_, created) in self.index.items() if self._expired(created)]:
+            self._forget(key)
+
+art_cache = ArtCache(ART_CACHE_DIR, ART_CACHE_MAX_MB * 1024 * 1024, ART_CACHE_MAX_DAYS * 86400)
+
+class ArtPool:
+    # Ready-made pictures waiting for the next !art. Each registered user can
+    # have one personalized picture; everyone else draws from the shared pool.
+    def __init__(self, size):
+        self.generic = deque(maxlen=size)
+        self.personal = {}
+
+    def add(self, prompt, image_data, user_id=None):
+        if user_id is None:
+            self.generic.append((prompt, image_data))
+        else:
+            self.personal[user_id] = (prompt, image_data)
+
+    def take(self, user_id):
+        if user_id in self.personal:
+            return self.personal.pop(user_id)
+        if self.generic:
+            return self.generic.popleft()
+        return None
+
+    def discard(self, user_id):
+        self.personal.pop(user_id, None)
+
+art_pool = ArtPool(ART_POOL_SIZE)
+
+async def get_art_image(prompt):
+    # Returns (image_bytes, from_cache), or None if the API refused the request
+    payload = build_art_payload(prompt)
+    key = ArtCache.key(payload)
+    image_data = await art_cache.get(key)
+    if image_data is not None:
+        return image_data, True
+    started = time.perf_counter()
+    base64_data = await request_art(payload)
+    art_generation_time.observe(time.perf_counter() - started)
+    if base64_data is None:
+        return None
+    image_data = await asyncio.get_running_loop().run_in_executor(art_executor, base64.b64decode, base64_data)
+    await art_cache.put(key, image_data)
+    return image_data, False
+
 @bot.command()
 async def art(ctx):
-    global art_count
-    art_left = 6-art_count
     user_id = str(ctx.author.id)
     profile = user_profiles.get(user_id)
-    last_art_time = load_last_art_time()
-
-    if is_new_day(last_art_time):
-        art_count = 0
-        save_last_art_time()
 
-
-    if art_count > 6:
+    # Reserve the generation before awaiting anything so concurrent requests can't overrun the quota
+    if not cooldowns.try_acquire("art"):
         embed = discord.Embed(
             description="I'm too tired to make more art right now... I'm busy with other things. Maybe later? (｡•́︿•̀｡)",
             color=discord.Color.red()
         )
         await ctx.send(embed=embed)
         return
+    await cooldowns.flush()
 
-    v_api = os.getenv('VENICE_API')
-   
-    if profile:
-        embed = discord.Embed(title=f"✨Yay~! {ctx.author.name}'s Profile!✨ (｡♥‿♥｡)", color=discord.Color.blue())
-        embed.add_field(name="Name", value=profile["name"], inline=False)
-
-    cute_nouns = ["kitten", "puppy", "bunny", "baby", "cloud", "star", "bear", "butterfly", "kittens", "cupcake", "flower", "chick", "cookie", "birdie", "deer", "panda", "frog", "koala", "rainbow", "daisy", "lamb", "honeybee", "squirrel", "sunflower", "pony", "snowflake", "pup", "sparkle", "dream", "lollipop", "rose", "buttercup", "jellybean", "baby chick", "puddle", "treasure", "snail"]
-    cute_adjectives = ["fluffy", "sparkly", "adorable", "sweet", "charming", "gentle", "playful", "soft", "lovely", "cute", "happy", "bright", "snuggly", "fuzzy", "cheerful", "whimsical", "delightful", "tender", "shiny", "rosy", "tasty", "warm", "peppy", "breezy", "magical", "sweetheart", "fluffy", "giddy", "colorful", "lovable", "bouncy", "calm", "pretty", "cozy", "fresh", "gentle", "glowy", "smiley", "sparkling", "twin", "friendly", "graceful", "carefree", "dazzling", "snug", "dreamy", "sunny", "puffy", "jolly", "mellow"]
-    cute_objects = ["heart", "balloon", "cupcake", "cookie", "star", "cloud", "teddy bear", "rainbow", "flower", "blanket", "butterfly", "headband", "whisk", "paintbrush", "camera", "bookmark", "gloves", "pajamas", "purse", "necklace", "hat", "scarf", "bowtie", "sticker", "guitar", "mug", "pencil case", "ball", "glitter", "cup", "note", "book", "bottle", "jewelry", "pen", "notepad", "sweets", "keychain", "coin", "bracelet", "flowerpot", "diary", "mirror", "bottle","snow globe", "painting", "clock"]
-    
-    #Customize art with user profile if available
-    if profile: 
-        if random.random() < 0.7:
-            adjective = random.choice(cute_adjectives)
-        else:
-            adjective = profile["favorite_color"]
-    else:
-        adjective = random.choice(cute_adjectives)
-   
-    if profile: 
-        if random.random() < 0.7:
-            noun = random.choice(cute_nouns)
-        else:  
-            noun = profile["favorite_animal"]
-    else:
-        noun = random.choice(cute_nouns)
-    
-    if profile: 
-        if random.random() < 0.7:
-            object_ = random.choice(cute_objects)
-        else:  
-            object_ = profile["favorite_food"]
-    else:
-        object_ = random.choice(cute_objects)
-    
-    
-    prompt = f"a {adjective} {noun} with a {object_} in a very kawaii style"
-    
-    print(prompt)
-
-    working_embed = discord.Embed(
-        description="Hold on! I'm making something cute for you! 🎨✨ (this might take a moment...)",
-        color=discord.Color.blue()
-    )
-    working_message = await ctx.send(embed=working_embed)
+    pooled = art_pool.take(user_id)
+    working_message = None
+    reserved = True
 
     try:
-        url = "https://api.venice.ai/api/v1/image/generate"
-        payload = {
-            "model": "flux-dev",
-            "prompt": prompt,
-            "style_preset": "Anime",
-            "height": 600,
-            "width": 600,
-            "steps": 20,
-            "cfg_scale": 7.5,
-            "seed": 123456789,
-            "lora_strength": 50,
-            "safe_mode": True,
-            "return_binary": False,
-            "hide_watermark": True,
-            "format": "webp",
-            "embed_exif_metadata": False,
-        }
-        headers = {
-            "Authorization": f"Bearer {v_api}",
-            "Content-Type": "application/json"
-        }
+        if pooled:
+            prompt, image_data = pooled
+            result = (image_data, False)
+            logger.info("Serving pre-generated art", extra={"prompt": prompt})
+        else:
+            prompt = build_art_prompt(profile)
+            logger.info("Generating art", extra={"prompt": prompt})
 
-        # Make the API request
-        response = requests.request("POST", url, json=payload, headers=headers)
+            working_embed = discord.Embed(
+                description="Hold on! I'm making something cute for you! 🎨✨ (this might take a moment...)",
+                color=discord.Color.blue()
+            )
+            working_message = await ctx.send(embed=working_embed)
+            result = await get_art_image(prompt)
         
-        if response.status_code != 200:
+        if result is None:
             error_embed = discord.Embed(
                 description="Oopsie, there was an issue fetching the art... (｡•́︿•̀｡)",
                 color=discord.Color.red()
@@ -653,109 +2697,340 @@ async def art(ctx):
             await working_message.edit(embed=error_embed)
             return
 
-        # Parse the JSON response
-        response_data = response.json()
+        image_data, from_cache = result
+        # Cached pictures didn't cost a generation, so they don't use up the quota
+        if from_cache:
+            cooldowns.refund("art")
+        reserved = False
+        art_left = max(0, cooldowns.remaining("art"))
+        loop = asyncio.get_running_loop()
+        image_data, extension = await loop.run_in_executor(art_executor, prepare_art, image_data)
+
+        art_embed = discord.Embed(
+            title=f"Here's your cute art, {ctx.author.name}! (｡♥‿♥｡)\nI can make {art_left} more pieces today!",
+            color=discord.Color.purple()
+        )
+        file = discord.File(io.BytesIO(image_data), filename=f"cute_art.{extension}")
+        art_embed.set_image(url=f"attachment://cute_art.{extension}")
         
-        # Extract the image data from the 'images' array
-        if "images" in response_data and response_data["images"]:
-            # The first image in the array contains the base64 data
-            base64_data = response_data["images"][0]
-            
-            # Decode the base64 data
-            image_data = base64.b64decode(base64_data)
-            
-            # Open the image from the decoded data
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Continue with saving and sending the image
-            with io.BytesIO() as image_file:
-                image.save(image_file, format="PNG")
-                image_file.seek(0)
-                
-                art_embed = discord.Embed(
-                    title=f"Here's your cute art, {ctx.author.name}! (｡♥‿♥｡)\nI can make {art_left} more pieces today!",
-                    color=discord.Color.purple()
-                )
-                file = discord.File(image_file, filename="cute_art.png")
-                art_embed.set_image(url="attachment://cute_art.png")
-                
-                await working_message.edit(embed=art_embed)
-                await ctx.send(file=file)
-                art_count +=1
+        if working_message:
+            await working_message.edit(embed=art_embed)
+            await ctx.send(file=file)
         else:
-            raise ValueError("No images found in the response")
+            await ctx.send(embed=art_embed, file=file)
             
-    except Exception as e:
+    except Exception:
         error_embed = discord.Embed(
             description="I don't feel like doing art right now... 😔",
             color=discord.Color.red()
         )
-        await working_message.edit(embed=error_embed)
-        print(f"Error occurred: {e}")
-        import traceback
-        traceback.print_exc()
+        if working_message:
+            await working_message.edit(embed=error_embed)
+        else:
+            await ctx.send(embed=error_embed)
+        logger.exception("Art request failed")
+    finally:
+        if reserved:
+            cooldowns.refund("art")
+
+@bot.command()
+async def stats(ctx):
+    lookups = art_cache.hits + art_cache.misses
+    hit_rate = f"{art_cache.hits / lookups:.0%}" if lookups else "n/a"
+    embed = discord.Embed(title="Net-chan's Stats! (๑•̀ㅂ•́)و✧", color=discord.Color.purple())
+    embed.add_field(
+        name="Art Cache",
+        value=(
+            f"Hits: {art_cache.hits} / Misses: {art_cache.misses} ({hit_rate})\n"
+            f"{len(art_cache.index)} pictures, {art_cache.total_bytes / (1024 * 1024):.1f} MB"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="Events",
+        value=f"{len(event_log)} in memory, {outbound_depth()} waiting to send",
+        inline=False
+    )
+    await ctx.send(embed=embed)
+
+# ----------------------------------------------------------------------------------
+# Performance Commands
+# ----------------------------------------------------------------------------------
+@bot.command()
+@commands.is_owner()
+async def perf(ctx, action: str = None):
+    action = (action or "").lower()
+    if action == "on":
+        loop_watchdog.enable()
+    elif action == "off":
+        loop_watchdog.disable()
+    elif action == "reset":
+        loop_watchdog.reset()
+        command_timings.clear()
+
+    state = "watching" if loop_watchdog.enabled else "off"
+    embed = discord.Embed(
+        title="Net-chan's Performance Notes (￣^￣ゞ",
+        description=f"Watchdog: {state} (threshold {PERF_SLOW_CALLBACK_MS} ms), loop lag {loop_lag * 1000:.0f} ms",
+        color=discord.Color.purple()
+    )
+    offenders = loop_watchdog.top()
+    embed.add_field(
+        name="Slowest callbacks",
+        value="\n".join(
+            f"`{truncate(where, 120)}` {caught}x, {total * 1000:.0f} ms total, worst {worst * 1000:.0f} ms"
+            for where, caught, total, worst in offenders
+        ) or "Nothing blocked me yet~!",
+        inline=False
+    )
+    slowest = sorted(command_timings.items(), key=lambda item: item[1][2], reverse=True)[:5]
+    embed.add_field(
+        name="Commands",
+        value="\n".join(
+            f"`!{name}` {runs} runs, avg {total / runs * 1000:.0f} ms, worst {worst * 1000:.0f} ms"
+            for name, (runs, total, worst) in slowest
+        ) or "No commands timed yet.",
+        inline=False
+    )
+    await ctx.send(embed=embed)
+
+@perf.error
+async def perf_error(ctx, error):
+    if isinstance(error, commands.NotOwner):
+        await ctx.send("That's only for my owner! (｀へ´)")
+    else:
+        logger.error("!perf failed: %s", error)
+
 # ----------------------------------------------------------------------------------
 # Music Command
 # ----------------------------------------------------------------------------------
 @bot.command()
-async def music(ctx):
-    song = get_song()
-    song_messages = [
-        f"Nyaa~! (≧◡≦) Net-chan is listening to {song.get('title')} by {song.get('artist')}! 🎶✨ It's so fun, it makes me wanna dance! (✿◕‿◕)💾🎵 Will you listen too, pwease? (๑•́‧̫•̀๑) 👉 {song.get('link')}",
-        f"U-uhm... (⁄ ⁄•⁄ω⁄•⁄ ⁄) Net-chan found a really nice song... it's {song.get('title')} by {song.get('artist')}! 🎶💜 It makes me feel all warm inside~ (*≧ω≦)✨ M-maybe you can listen too...? I-if you want to... 👉 {song.get('link')} 💕",
-        f"Waah~! (ﾉ´ヮ`)ﾉ*:･ﾟ✧ {song.get('title')} by {song.get('artist')} is soooo good!! 🎶💾 My circuits are all tingly~! (๑>ᴗ<๑) Heehee~ will you listen with me, pwease? (✿˶˘ ᴗ ˘˶)💜👉 {song.get('link')}",
-        f"Heehee~! (✿◕‿◕) Net-chan found a super cool song—it's {song.get('title')} by {song.get('artist')}! 🎶💾 I feel so happy when I listen to it~!! (๑˃̵ᴗ˂̵)✨ Wanna listen with me, bestie? (｡♥‿♥｡) 👉 {song.get('link')}",
-        f"Uwu~! Net-chan's circuits are vibing to {song.get('title')} by {song.get('artist')}! ⚡🎶 You should totally listen too, nya~! 💾💜 Clicky-click here! 👉 {song.get('link')}"
-    ]
-    
-    if not song:
-        song_message = "Uuuughhh~! (╥﹏╥) I haven’t had any time to dig up fresh bangers…! My playlist is just dusty old tracks on repeat~! ✨💿💔 Sooo lame...!! (ಥ﹏ಥ) Pls don’t ask me for recs rn, I got nothin’! 💀💿💨"
+async def music(ctx, *, artist: str = None):
+    song = music_catalog.pick(artist)
+
+    if song is None:
+        if artist:
+            song_message = f"Hmm~? (・・ )? I don't have anything by {artist} on my playlist yet...! Maybe you can recommend some to me? (๑•́‧̫•̀๑)"
+        else:
+            song_message = "Uuuughhh~! (╥﹏╥) I haven’t had any time to dig up fresh bangers…! My playlist is just dusty old tracks on repeat~! ✨💿💔 Sooo lame...!! (ಥ﹏ಥ) Pls don’t ask me for recs rn, I got nothin’! 💀💿💨"
         embed = discord.Embed(description=song_message, color=discord.Color.red())
         await ctx.send(embed=embed)
+        return
+
+    song_messages = [
+        f"Nyaa~! (≧◡≦) Net-chan is listening to {song.title} by {song.artist}! 🎶✨ It's so fun, it makes me wanna dance! (✿◕‿◕)💾🎵 Will you listen too, pwease? (๑•́‧̫•̀๑) 👉 {song.link}",
+        f"U-uhm... (⁄ ⁄•⁄ω⁄•⁄ ⁄) Net-chan found a really nice song... it's {song.title} by {song.artist}! 🎶💜 It makes me feel all warm inside~ (*≧ω≦)✨ M-maybe you can listen too...? I-if you want to... 👉 {song.link} 💕",
+        f"Waah~! (ﾉ´ヮ`)ﾉ*:･ﾟ✧ {song.title} by {song.artist} is soooo good!! 🎶💾 My circuits are all tingly~! (๑>ᴗ<๑) Heehee~ will you listen with me, pwease? (✿˶˘ ᴗ ˘˶)💜👉 {song.link}",
+        f"Heehee~! (✿◕‿◕) Net-chan found a super cool song—it's {song.title} by {song.artist}! 🎶💾 I feel so happy when I listen to it~!! (๑˃̵ᴗ˂̵)✨ Wanna listen with me, bestie? (｡♥‿♥｡) 👉 {song.link}",
+        f"Uwu~! Net-chan's circuits are vibing to {song.title} by {song.artist}! ⚡🎶 You should totally listen too, nya~! 💾💜 Clicky-click here! 👉 {song.link}"
+    ]
+    embed = discord.Embed(description=random.choice(song_messages), color=discord.Color.blue())
+    if song.image:
+        await send_asset(ctx, embed, song.image)
     else:
-        song_message = random.choice(song_messages)
-        embed = discord.Embed(description=song_message, color=discord.Color.blue())
-        file = discord.File(song.get('image'), filename="album_cover.jpg")
-        embed.set_image(url="attachment://album_cover.jpg")
-        await ctx.send(embed=embed, file=file)
+        await ctx.send(embed=embed)
 
 # ==================================================================================
-# FLASK WEBHOOK HANDLING
+# WEBHOOK HANDLING
 # ==================================================================================
-app = Flask(__name__)
-
-@app.route("/webhook", methods=["POST"])
-def webhook():
-    global webhook_log
-    data = request.json
-    message = data.get("message", "No details provided.")
-    event_type = data.get("event", "generic")
-    reply = get_response(event_type, message)
-
-    print(f"Received event_type: {event_type}, message: {message}")
-    
-    log_entry = f"{event_type}: {message}"
-    webhook_log.append(log_entry)
-    
-    if len(webhook_log) > 100:
-        webhook_log = webhook_log[-100:]
+def parse_webhook_keys(value):
+    keys = {}
+    for entry in value.split(","):
+        source, _, key = entry.strip().partition(":")
+        if source and key:
+            keys[source] = key
+    return keys
+
+class WebhookVerifier:
+    # Signed requests carry X-NetChan-Source, X-NetChan-Timestamp (unix
+    # seconds) and X-NetChan-Signature, the hex HMAC-SHA256 of
+    # "<timestamp>.<body>" under that source's key. Each key is loaded into
+    # an hmac object once; requests copy it instead of re-keying. Everything
+    # that can be checked from the headers is checked before the body is read.
+    def __init__(self, keys, max_skew):
+        self.macs = {source: hmac.new(key.encode("utf-8"), digestmod=hashlib.sha256) for source, key in keys.items()}
+        self.max_skew = max_skew
+        self.seen = OrderedDict()
+
+    @property
+    def enabled(self):
+        return bool(self.macs)
+
+    def check_headers(self, headers):
+        # Returns (source, mac, timestamp, signature), or the reason to reject
+        source = headers.get("X-NetChan-Source")
+        mac = self.macs.get(source)
+        if mac is None:
+            return "unknown source"
+        timestamp = headers.get("X-NetChan-Timestamp", "")
+        signature = headers.get("X-NetChan-Signature", "").removeprefix("sha256=").lower()
+        try:
+            sent = int(timestamp)
+        except ValueError:
+            return "missing timestamp"
+        if abs(time.time() - sent) > self.max_skew:
+            return "timestamp outside the replay window"
+        if len(signature) != mac.digest_size * 2:
+            return "missing signature"
+        return source, mac, timestamp, signature
+
+    def verify(self, mac, timestamp, signature, body):
+        mac = mac.copy()
+        mac.update(timestamp.encode("ascii"))
+        mac.update(b".")
+        mac.update(body)
+        if not hmac.compare_digest(mac.hexdigest(), signature):
+            return "bad signature"
+        # A valid signature is only accepted once while its timestamp is valid
+        now = time.time()
+        while self.seen and (next(iter(self.seen.values())) < now or len(self.seen) >= WEBHOOK_REPLAY_CACHE):
+            self.seen.popitem(last=False)
+        if signature in self.seen:
+            return "replayed request"
+        self.seen[signature] = now + 2 * self.max_skew
+        return None
 
-    channel = bot.get_channel(CHANNEL_ID)
-    if channel:
-        embed = discord.Embed(description=reply, color=discord.Color.blue())
-        embed.add_field(name="Event Type", value=event_type, inline=False)
-        embed.add_field(name="Message", value=message, inline=False)
+webhook_verifier = WebhookVerifier(parse_webhook_keys(WEBHOOK_KEYS), WEBHOOK_MAX_SKEW)
+
+def webhook_error(status, reason, headers=None):
+    webhook_requests_total.inc(str(status))
+    return web.json_response({"status": "error", "reason": reason}, status=status, headers=headers)
+
+async def webhook(request):
+    source = None
+    if webhook_verifier.enabled:
+        checked = webhook_verifier.check_headers(request.headers)
+        if isinstance(checked, str):
+            return webhook_error(401, checked)
+        source, mac, timestamp, signature = checked
+        body = await request.read()
+        reason = webhook_verifier.verify(mac, timestamp, signature, body)
+        if reason:
+            return webhook_error(401, reason)
+        limit_key = source
+    else:
+        body = await request.read()
+        limit_key = request.remote or "unknown"
 
-        asyncio.run_coroutine_threadsafe(channel.send(embed=embed), bot.loop)
+    if WEBHOOK_RATE_LIMIT and not cooldowns.try_acquire("webhook", limit_key):
+        retry_after = str(max(1, round(60 / WEBHOOK_RATE_LIMIT)))
+        return webhook_error(429, "rate limited", {"Retry-After": retry_after})
 
-    return {"status": "ok"}
+    try:
+        data = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return webhook_error(400, "invalid JSON")
+    if not isinstance(data, dict):
+        return webhook_error(400, "expected a JSON object")
+
+    message = str(data.get("message", "No details provided."))
+    event_type = str(data.get("event", "generic"))
+    if source is None and data.get("source"):
+        source = str(data["source"])
+    try:
+        priority = int(data.get("priority", 0))
+    except (TypeError, ValueError):
+        return webhook_error(400, "priority must be a number")
+    tags = data.get("tags")
+    tags = tuple(sorted(str(tag).lower() for tag in tags)) if isinstance(tags, list) else ()
+    reply = get_response(event_type, message)
 
-def run_flask():
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    logger.info("Received webhook event", extra={"event_type": event_type, "source": source, "detail": message, "sample": "webhook"})
+
+    channels = route_table.channels_for(event_type.lower(), source, tags)
+    if not channels:
+        return webhook_error(429, "route rate limited", {"Retry-After": str(INGRESS_RETRY_AFTER)})
+
+    notification = Notification(event_type, message, reply, discord.Color.blue(), time.monotonic(), priority)
+    accepted = [get_outbound_queue(channel_id).put(notification) for channel_id in channels]
+    if not any(accepted):
+        if gateway_ready.is_set():
+            return webhook_error(429, "queue full", {"Retry-After": str(INGRESS_RETRY_AFTER)})
+        return webhook_error(503, "Discord is unreachable and the queue is full", {"Retry-After": str(GATEWAY_RETRY_AFTER)})
+
+    # Only accepted events go in the log, so a sender's retries aren't recorded twice
+    record_event("webhook", event_type, message)
+
+    # 202: accepted, but it goes out only after the gateway reconnects
+    status = 200 if gateway_ready.is_set() else 202
+    webhook_requests_total.inc(str(status))
+    return web.json_response({"status": "ok" if status == 200 else "queued"}, status=status)
+
+async def metrics_endpoint(request):
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+async def start_webhook_server():
+    app = web.Application()
+    app.router.add_post("/webhook", webhook)
+    app.router.add_get("/metrics", metrics_endpoint)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT, backlog=WEBHOOK_BACKLOG)
+    await site.start()
+    logger.info("Webhook server listening on %s:%d", WEBHOOK_HOST, WEBHOOK_PORT)
+    if not webhook_verifier.enabled:
+        logger.warning("WEBHOOK_KEYS is not set, accepting unsigned webhooks from anyone who can reach the port.")
+    return runner
 
 # ==================================================================================
 # MAIN EXECUTION
 # ==================================================================================
+def open_state():
+    # Everything that starts threads or touches memory/ happens here instead
+    # of at import: multiprocessing workers re-import this file, and two
+    # processes repairing the journal or evicting the art cache would clash.
+    global log_listener
+    log_listener = setup_logging()
+    event_journal.open()
+    user_profiles.open()
+    cooldowns.open()
+    scheduler.open()
+    art_cache.open()
+
+async def main():
+    open_state()
+    startup_mark("init")
+    restore_event_log()
+    async with bot:
+        restore_spilled_notifications()
+        # The webhook port opens first; everything else can warm up while
+        # the gateway connects.
+        runner = await start_webhook_server()
+        startup_mark("webhook listening")
+        loop = asyncio.get_running_loop()
+        preload_future = loop.run_in_executor(None, assets.preload)
+        preload_future.add_done_callback(log_preload_result)
+        schedule_jobs()
+        scheduler.start()
+        lag_task = loop.create_task(monitor_loop_lag())
+        if PERF_ENABLED:
+            loop_watchdog.enable()
+        # docker stop and systemctl stop send SIGTERM; closing the bot makes
+        # bot.start() return so the cleanup below saves cooldowns and the journal
+        closing = []
+        try:
+            loop.add_signal_handler(signal.SIGTERM, lambda: closing.append(loop.create_task(bot.close())))
+        except NotImplementedError:
+            pass  # No signal handlers on Windows event loops
+        try:
+            await bot.start(TOKEN)
+        finally:
+            lag_task.cancel()
+            loop_watchdog.disable()
+            webhook_aggregator.close()
+            await runner.cleanup()
+            await scheduler.close()
+            await event_journal.close()
+            await cooldowns.close()
+            await close_http_session()
+            user_profiles.close()
+            close_moderation_executor()
+            spill_executor.shutdown()
+            corpus_executor.shutdown()
+            log_listener.stop()
+
 if __name__ == "__main__":
-    Thread(target=run_flask).start()
-    bot.run(TOKEN)
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass